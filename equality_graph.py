@@ -0,0 +1,194 @@
+import heapq
+import union_find
+
+
+class EqualityGraph:
+    """ Undirected graph of an equality formula: the nodes are the term variables,
+    and each atom is an edge between the nodes of its two sides. """
+
+    def __init__(self, identifier_map, variables):
+
+        self.index = dict()
+        for i, v in enumerate(variables):
+            self.index[v.identifier] = i
+        self.adjacent = [set() for _ in variables]
+        self.edges = dict()  # for each edge (i, j) with i < j, the atoms between i and j
+        self.loops = []  # atoms whose two sides are the same node
+
+        for var in identifier_map:
+            relation = identifier_map[var]
+            i = self.index[relation.left.identifier]
+            j = self.index[relation.right.identifier]
+            if i == j:
+                self.loops.append(var)
+            else:
+                self.edges.setdefault(edge(i, j), []).append(var)
+                self.adjacent[i].add(j)
+                self.adjacent[j].add(i)
+
+    def __len__(self):
+        return len(self.adjacent)
+
+    def biconnected_components(self):
+        """ Returns the atoms of each biconnected component. The atoms with the same sides
+        are distinct edges, so that they form a component together. """
+
+        adjacent = [[] for _ in self.adjacent]
+        for (i, j), atoms in self.edges.items():
+            for var in atoms:
+                adjacent[i].append((j, var))
+                adjacent[j].append((i, var))
+
+        index = [-1] * len(adjacent)  # depth-first numbering of the nodes
+        low = [0] * len(adjacent)  # lowest index reachable with a single back edge from the subtree
+        counter = 0
+        visited_edges = []
+        components = []
+
+        for root in range(len(adjacent)):
+            if index[root] != -1:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack = [(root, None, iter(adjacent[root]))]  # iterative depth-first search, with the edge to the parent
+
+            while stack:
+                v, parent_edge, neighbors = stack[-1]
+                for w, var in neighbors:
+                    if var == parent_edge:
+                        continue
+                    if index[w] == -1:
+                        visited_edges.append(var)
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append((w, var, iter(adjacent[w])))
+                        break
+                    elif index[w] < index[v]:  # back edge
+                        visited_edges.append(var)
+                        low[v] = min(low[v], index[w])
+                else:
+                    stack.pop()
+                    if stack:
+                        u = stack[-1][0]
+                        low[u] = min(low[u], low[v])
+                        if low[v] >= index[u]:  # u separates the subtree of v: its edges form a component
+                            component = []
+                            while not component or component[-1] != parent_edge:
+                                component.append(visited_edges.pop())
+                            components.append(component)
+
+        return components
+
+    def pure_atoms(self, polarity):
+        """ Returns the atoms that no model has to check, given the polarity of the atoms
+        in the formula: the ones outside the biconnected components that can have a conflict """
+
+        pure = set(var for var in self.loops if polarity.get(var) not in [-1, 0])
+        for component in self.biconnected_components():
+            if len(component) < 2 or all(polarity.get(var) not in [-1, 0] for var in component):
+                pure.update(component)
+
+        return pure
+
+    def components(self):
+        """ Returns the nodes of each connected component with at least one edge """
+
+        classes = union_find.UnionFind(len(self.adjacent))
+        for i, j in self.edges:
+            classes.union(i, j)
+
+        components = dict()
+        for i in range(len(self.adjacent)):
+            if self.adjacent[i]:
+                components.setdefault(classes.find(i), []).append(i)
+
+        return list(components.values())
+
+    def ranges(self, polarity=None):
+        """ Returns the number of values of each node with an edge: at most d + 1 in a
+        component with d edges whose atoms can be false """
+
+        components = self.components()
+        component_of = dict((i, c) for c, component in enumerate(components) for i in component)
+        sizes = [1] * len(components)
+        for (i, j), atoms in self.edges.items():
+            if polarity is None or any(polarity.get(var) in [-1, 0] for var in atoms):
+                sizes[component_of[i]] += 1
+
+        ranges = dict()
+        for c, component in enumerate(components):
+            for k, i in enumerate(component):
+                ranges[i] = min(k + 1, sizes[c])
+
+        return ranges
+
+    def triangulate(self, heuristic='min_degree'):
+        """ Makes the graph chordal, in the elimination order of the heuristic ('min_degree'
+        or 'min_fill'). Returns the added edges, and the triangles of the chordal graph. """
+
+        adjacent = [set(neighbors) for neighbors in self.adjacent]
+        if heuristic == 'min_degree':
+            cost = lambda v: len(adjacent[v])
+        elif heuristic == 'min_fill':
+            cost = lambda v: len(missing_edges(adjacent, v))
+        else:
+            raise ValueError("Unknown elimination heuristic: " + str(heuristic))
+
+        costs = [cost(v) for v in range(len(adjacent))]
+        heap = [(c, v) for v, c in enumerate(costs)]  # the entries with an outdated cost are skipped
+        heapq.heapify(heap)
+        eliminated = [False] * len(adjacent)
+        fill = []
+        triangles = []
+
+        while heap:
+            c, v = heapq.heappop(heap)
+            if eliminated[v] or c != costs[v]:
+                continue
+            changed = set(adjacent[v])  # the nodes whose cost may change
+            for i, j in missing_edges(adjacent, v):
+                adjacent[i].add(j)
+                adjacent[j].add(i)
+                fill.append(edge(i, j))
+                if heuristic == 'min_fill':
+                    changed.update(adjacent[i] & adjacent[j])  # i and j are now joined in their neighborhood
+
+            neighbors = sorted(adjacent[v])
+            for x, i in enumerate(neighbors):
+                for j in neighbors[x + 1:]:
+                    triangles.append((v, i, j))  # every triangle is found when its first node is eliminated
+
+            for i in neighbors:
+                adjacent[i].discard(v)
+            eliminated[v] = True
+
+            for u in changed:
+                if not eliminated[u]:
+                    costs[u] = cost(u)
+                    heapq.heappush(heap, (costs[u], u))
+
+        return fill, triangles
+
+
+def edge(i, j):
+    return (i, j) if i < j else (j, i)
+
+
+def missing_edges(adjacent, v):
+    """ Returns the edges between the neighbors of v that are not in the graph """
+
+    neighbors = sorted(adjacent[v])
+    return [(i, j) for x, i in enumerate(neighbors) for j in neighbors[x + 1:] if j not in adjacent[i]]
+
+
+def polarity(formula):
+    """ Returns 1 for the variables that only occur positively in the formula, -1 for the
+    ones that only occur negatively, and 0 for the others """
+
+    signs = dict()
+    for clause in formula:
+        for lit in clause:
+            sign = 1 if lit > 0 else -1
+            signs[abs(lit)] = sign if signs.get(abs(lit), sign) == sign else 0
+
+    return signs
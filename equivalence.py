@@ -1,5 +1,6 @@
 import pysat
 import union_find
+import equality_graph
 import time
 
 
@@ -12,6 +13,14 @@ class Variable:
         return self.identifier == other.identifier
 
 
+class Application:
+    """ Application of an uninterpreted function to terms (Variables or Applications) """
+
+    def __init__(self, function, *arguments):
+        self.function = function
+        self.arguments = list(arguments)
+
+
 class EquivalenceOp:
 
     def __init__(self, variable1, variable2):
@@ -32,96 +41,678 @@ class Disequality(EquivalenceOp):
 
 
 class Theory:
+    """ Equality theory, used by the SAT solver through an incremental protocol
+    (on_new_level, on_assign, on_backtrack and final_check) """
 
     def __init__(self, identifier_map, variables, model=None):
 
         self.identifier_map = identifier_map
         self.variables = variables
         self.model = model
-        self.nodes = dict()
+        self.index = dict()
         self.sat = pysat.lit_Undef
+        self.conflict = None  # disequality atom violated by the current relation
+        self.conflict_level = 0  # level at which the current conflict (if any) appeared
 
-        for v in self.variables:
-            self.nodes[v.identifier] = union_find.UnionNode(v)
+        for i, v in enumerate(self.variables):
+            self.index[v.identifier] = i
+        self.classes = union_find.BacktrackableUnionFind(len(self.variables))
+        self.trail = []  # assigned atoms, in the order they were assigned
+        self.trail_levels = []  # splits self.trail in decision levels
+        self.assigned = set()  # variables of the atoms in self.trail
+        self.candidates = []  # atoms that the relation may decide since the last propagate
+        self.disequalities = [[] for _ in self.variables]  # for each class, the assigned disequalities touching it
+        self.members = [[i] for i in range(len(self.variables))]  # for each class, its nodes
+        self.node_atoms = []  # for each node, the atoms with a side on it
+        self.undo = []  # changes of self.disequalities, undone when backtracking
+        self.marks = []  # self.marks[i] is the size of self.undo when level i + 1 was opened
+        self.reasons = dict()  # for each implied disequality, the disequality that separates its sides
+        self.triangles = False  # whether conflicts are explained by triangle lemmas (see triangle_lemmas)
+        self.new_var = None  # returns a new SAT variable, for the chord atoms of the triangle lemmas
+        self.sides = dict()  # an atom for each pair of nodes (i, j) with i < j joined by atoms
+        self.index_sides()
+        self.index_atoms()
 
     def get_corresponding_nodes(self, varname):
 
         relation = self.identifier_map[varname]
-        left = relation.left
-        right = relation.right
-        left_node = self.nodes[left.identifier]
-        right_node = self.nodes[right.identifier]
+        left_node = self.node(relation.left)
+        right_node = self.node(relation.right)
 
         return left_node, right_node
 
-    def clear_relation(self):
+    def node(self, term):
+        return self.index[term.identifier]
+
+    def merge(self, i, j, reason):
+        """ Merges the classes of the nodes i and j because of the atom reason.
+        Returns False if they were already the same class """
+
+        i_root, j_root = self.classes.find(i), self.classes.find(j)
+        if not self.classes.union(i, j, reason):
+            return False
+        root = self.classes.find(i)
+        self.merge_disequalities(root, j_root if root == i_root else i_root)
+        self.merge_members(root, j_root if root == i_root else i_root)
+        return True
+
+    def merge_disequalities(self, root, absorbed):
+        """ Called when the class absorbed is merged into the class root. Only a disequality
+        between the two classes can be violated, and it touches both: the shorter of their
+        lists is checked, then appended to the longer one, which the new class keeps. """
+
+        shorter, longer = self.disequalities[absorbed], self.disequalities[root]
+        swapped = len(shorter) > len(longer)
+        if swapped:
+            shorter, longer = longer, shorter
+            self.disequalities[root], self.disequalities[absorbed] = longer, shorter
+        self.undo.append(('disequalities', root, absorbed, swapped, len(longer)))
+
+        if self.sat != pysat.lit_False:
+            for var in shorter:
+                left_node, right_node = self.get_corresponding_nodes(var)
+                if self.classes.same(left_node, right_node):
+                    self.set_conflict(var)
+                    break
+        longer.extend(shorter)
+
+    def merge_members(self, root, absorbed):
+        """ Called when the class absorbed is merged into the class root. The atoms of the nodes
+        of the smaller class are checked by the next propagate: an equality implied by the merge
+        has a side in each class, so it is among them. The new class keeps the longer list. """
+
+        shorter, longer = self.members[absorbed], self.members[root]
+        swapped = len(shorter) > len(longer)
+        if swapped:
+            shorter, longer = longer, shorter
+            self.members[root], self.members[absorbed] = longer, shorter
+        self.undo.append(('members', root, absorbed, swapped, len(longer)))
+
+        for node in shorter:
+            self.candidates += self.node_atoms[node]
+        longer.extend(shorter)
+
+    def add_disequality(self, var):
+        """ Indexes the assigned disequality var by the classes of its sides, or records it
+        as the conflict if its sides are already in the same class """
+
+        left_node, right_node = self.get_corresponding_nodes(var)
+        left_root, right_root = self.classes.find(left_node), self.classes.find(right_node)
+        if left_root == right_root:
+            if self.sat != pysat.lit_False:
+                self.set_conflict(var)
+            return
+        for root in [left_root, right_root]:
+            self.disequalities[root].append(var)
+            self.undo.append(('disequality', root))
+        # The atoms between the two classes are now implied false, they are on the nodes of both
+        smaller = left_root if len(self.members[left_root]) <= len(self.members[right_root]) else right_root
+        for node in self.members[smaller]:
+            self.candidates += self.node_atoms[node]
+
+    def set_conflict(self, var):
+
+        self.sat = pysat.lit_False
+        self.conflict = var
+        self.conflict_level = len(self.trail_levels)
+
+    def undo_change(self, change):
+
+        if change[0] == 'disequality':
+            self.disequalities[change[1]].pop()
+        elif change[0] == 'sent':
+            self.candidates.append(change[1])  # may still be implied at the remaining levels
+        else:
+            kind, root, absorbed, swapped, size = change
+            lists = self.disequalities if kind == 'disequalities' else self.members
+            del lists[root][size:]
+            if swapped:
+                lists[root], lists[absorbed] = lists[absorbed], lists[root]
+
+    def explain_nodes(self, i, j):
+        """ Returns the atoms that merged the classes of the nodes i and j """
+        return self.classes.explain(i, j)
+
+    def index_sides(self):
+
+        self.sides = dict()
+        for var in self.identifier_map:
+            self.sides.setdefault(equality_graph.edge(*self.get_corresponding_nodes(var)), var)
+
+    def index_atoms(self):
+
+        self.node_atoms = [[] for _ in self.variables]
+        for var in self.identifier_map:
+            self.index_atom(var)
+
+    def index_atom(self, var):
+        """ Puts the atom in the lists of the nodes of its sides, and checks it at the next propagate """
 
-        for key in self.nodes:
-            self.nodes[key].clear()
+        for node in set(self.get_corresponding_nodes(var)):
+            self.node_atoms[node].append(var)
+        self.candidates.append(var)
 
-    def build_relation(self):
+    def add_atom(self, var, relation):
+        """ Declares a new atom. The nodes of its sides are created if needed. """
 
-        for var in self.model:
-            if abs(var) in self.identifier_map:
-                left_node, right_node = self.get_corresponding_nodes(abs(var))
+        self.identifier_map[var] = relation
+        for side in [relation.left, relation.right]:
+            if side.identifier not in self.index:
+                self.index[side.identifier] = self.classes.add()
+                self.variables.append(side)
+                self.disequalities.append([])
+                self.members.append([self.index[side.identifier]])
+                self.node_atoms.append([])
+        self.sides.setdefault(equality_graph.edge(*self.get_corresponding_nodes(var)), var)
+        self.index_atom(var)
 
-                if var > 0:
-                    left_node.merge(right_node)
+    def remove_atom(self, var):
+        """ Forgets an atom. An atom that is assigned is kept, since the relation depends on it.
+        Returns whether the atom was removed. """
+
+        if var in self.assigned:
+            return False
+        nodes = equality_graph.edge(*self.get_corresponding_nodes(var))
+        for node in set(nodes):
+            self.node_atoms[node].remove(var)
+        del self.identifier_map[var]
+        if self.sides[nodes] == var:
+            del self.sides[nodes]
+            for other in self.identifier_map:  # another atom may have the same sides
+                if equality_graph.edge(*self.get_corresponding_nodes(other)) == nodes:
+                    self.sides[nodes] = other
+                    break
+        self.reasons.pop(var, None)
+        return True
+
+    def prune(self, formula):
+        """ Preprocessing, before the theory is used: removes the atoms that cannot take part
+        in a conflict (see EqualityGraph.pure_atoms), and the term variables left without
+        atoms. Returns the removed atoms that the models must set to true. """
+
+        polarity = equality_graph.polarity(formula)
+        pure = equality_graph.EqualityGraph(self.identifier_map, self.variables).pure_atoms(polarity)
+        self.restrict({var: relation for var, relation in self.identifier_map.items() if var not in pure})
+
+        return [var for var in pure if polarity.get(var) == 1]
+
+    def substitute(self, formula):
+        """ Preprocessing, before the theory is used: the level-0 equalities are substituted
+        (see substitute_equalities). Returns the simplified formula, and the values of the
+        atoms removed from it. """
+
+        identifier_map, formula, fixed = substitute_equalities(self.identifier_map, formula)
+        self.restrict(identifier_map)
+
+        return formula, fixed
+
+    def restrict(self, identifier_map):
+        """ Replaces the atoms, and drops the term variables left without atoms """
+
+        self.identifier_map = identifier_map
+        sides = set()
+        for relation in self.identifier_map.values():
+            sides.update([relation.left.identifier, relation.right.identifier])
+        self.variables = [v for v in self.variables if v.identifier in sides]
+        self.index = dict()
+        for i, v in enumerate(self.variables):
+            self.index[v.identifier] = i
+        self.classes = union_find.BacktrackableUnionFind(len(self.variables))
+        self.clear_relation()
+        self.index_sides()
+        self.index_atoms()
+
+    def clear_relation(self):
+
+        self.classes.clear()
+        self.disequalities = [[] for _ in self.variables]
+        self.members = [[i] for i in range(len(self.variables))]
+        self.undo = []
+        self.marks = []
+        self.trail = []
+        self.trail_levels = []
+        self.assigned.clear()
+        self.candidates = []
+        self.sat = pysat.lit_Undef
 
     def check(self, model=None):
+        """ Checks a complete model from scratch """
 
         if model is not None:
             self.model = model
-            self.clear_relation()
+        self.clear_relation()
+        self.on_assign(self.model)
+
+        return self.final_check()
+
+    def on_new_level(self):
+        """ Called by the SAT solver before it sends the atoms of a new decision level """
+
+        self.classes.checkpoint()
+        self.trail_levels.append(len(self.trail))
+        self.marks.append(len(self.undo))
+
+    def on_backtrack(self, level):
+        """ Called by the SAT solver when it backtracks to the given decision level.
+        Only the atoms assigned at the abandoned levels are undone, and the atoms sent
+        at these levels join the candidates not checked yet (see undo_change). """
+
+        if len(self.trail_levels) <= level:
+            return
 
-        self.build_relation()
+        self.classes.backtrack(level)
+        for x in range(len(self.undo) - 1, self.marks[level] - 1, -1):
+            self.undo_change(self.undo[x])
+        del self.undo[self.marks[level]:]
+        del self.marks[level:]
+        for var in self.trail[self.trail_levels[level]:]:
+            self.assigned.discard(abs(var))
+        del self.trail[self.trail_levels[level]:]
+        del self.trail_levels[level:]
 
-        self.sat = pysat.lit_True
+        if self.sat == pysat.lit_False and level < self.conflict_level:
+            self.sat = pysat.lit_True
 
-        for var in self.model:
-            if abs(var) in self.identifier_map:
-                left_node, right_node = self.get_corresponding_nodes(abs(var))
+    def on_assign(self, lits):
+        """ Called by the SAT solver with the literals added to its trail since the last
+        call: the cheap partial check """
 
-                if not var > 0 and left_node == right_node:
-                    self.sat = pysat.lit_False
+        atoms = [var for var in lits if abs(var) in self.identifier_map]
+        self.trail += atoms
+        self.assigned.update(abs(var) for var in atoms)
+
+        for var in atoms:
+            if var > 0:
+                left_node, right_node = self.get_corresponding_nodes(var)
+                self.merge(left_node, right_node, var)
+            else:
+                self.add_disequality(-var)
+        if self.sat == pysat.lit_Undef:
+            self.sat = pysat.lit_True
 
         return self.sat
 
+    def is_atom(self, var):
+        """ Called by the SAT solver (pysat.NewAtoms policy): True if var is an atom of the theory """
+
+        return var in self.identifier_map
+
+    def implied_atoms(self, candidates):
+        """ Returns the unassigned atoms among candidates decided by the relation: equalities
+        between two nodes of the same class, and disequalities between two classes separated
+        by an assigned disequality """
+
+        implied = []
+        checked = set()
+        for var in candidates:
+            if var in checked or var in self.assigned or var not in self.identifier_map:
+                continue
+            checked.add(var)
+            left_node, right_node = self.get_corresponding_nodes(var)
+            left_root, right_root = self.classes.find(left_node), self.classes.find(right_node)
+            if left_root == right_root:
+                implied.append(var)
+            else:
+                separation = self.separation(left_root, right_root)
+                if separation is not None:
+                    implied.append(-var)
+                    self.reasons[var] = separation
+
+        return sorted(implied, key=abs)
+
+    def separation(self, left_root, right_root):
+        """ Returns an assigned disequality between the two classes, with the nodes of its sides
+        in left_root and in right_root, or None. Only the shorter index of the two is read. """
+
+        shorter = min(self.disequalities[left_root], self.disequalities[right_root], key=len)
+        for var in shorter:
+            left_node, right_node = self.get_corresponding_nodes(var)
+            roots = (self.classes.find(left_node), self.classes.find(right_node))
+            if roots == (left_root, right_root):
+                return var, left_node, right_node
+            if roots == (right_root, left_root):
+                return var, right_node, left_node
+        return None
+
+    def priorities(self):
+        """ Called by the SAT solver to seed its scores: the degree of each atom in the equality
+        graph, i.e. the number of atoms that share one of its sides """
+
+        degree = [0] * len(self.variables)
+        for var in self.identifier_map:
+            for node in self.get_corresponding_nodes(var):
+                degree[node] += 1
+
+        priorities = dict()
+        for var in self.identifier_map:
+            left_node, right_node = self.get_corresponding_nodes(var)
+            priorities[var] = degree[left_node] + degree[right_node] - 2
+        return priorities
+
+    def suggest_phase(self, var):
+        """ Called by the SAT solver before deciding var. An atom between two classes touched by
+        assigned disequalities is better decided false, since merging them may violate one.
+        Returns None to keep the phase of the SAT solver. """
+
+        if var not in self.identifier_map or self.sat == pysat.lit_False:
+            return None
+        left_node, right_node = self.get_corresponding_nodes(var)
+        left_root, right_root = self.classes.find(left_node), self.classes.find(right_node)
+        if left_root == right_root:
+            return True
+        if self.disequalities[left_root] or self.disequalities[right_root]:
+            return False
+        return None
+
+    def propagate(self):
+        """ Called by the SAT solver after on_assign: returns the atoms implied by the relation.
+        Only the atoms of the classes changed since the last call are read (see merge_members). """
+
+        if self.sat == pysat.lit_False or not self.candidates:
+            return []
+        candidates, self.candidates = self.candidates, []
+
+        implied = self.implied_atoms(candidates)
+        for lit in implied:
+            self.undo.append(('sent', abs(lit)))  # checked again when its level is abandoned
+        return implied
+
+    def reason(self, lit):
+        """ Called by the SAT solver when the conflict analysis needs the reason of an atom
+        returned by propagate. The clause is computed from the proof forest only now. """
+
+        var = abs(lit)
+        left_node, right_node = self.get_corresponding_nodes(var)
+        clause = [lit]
+
+        if lit > 0:
+            atoms = self.explain_nodes(left_node, right_node)
+        else:
+            disequality, left_side, right_side = self.reasons[var]
+            atoms = self.explain_nodes(left_node, left_side) + self.explain_nodes(right_node, right_side)
+            clause += [disequality]
+
+        for atom in atoms:
+            clause += [-atom]
+        return clause
+
+    def final_check(self):
+        """ Called by the SAT solver once every variable is assigned. Conflicts are
+        already found by on_assign, so there is nothing left to check. """
+
+        if self.sat == pysat.lit_Undef:
+            self.sat = pysat.lit_True
+
+        return self.sat
+
+    def explain(self, var):
+        """ Returns the equality atoms that merged the two sides of the given atom """
+
+        left_node, right_node = self.get_corresponding_nodes(var)
+
+        return self.explain_nodes(left_node, right_node)
+
     def learn_clause(self):
+        """ The violated disequality cannot hold together with the equalities on the path
+        between its two sides in the proof forest: the lemma forbids only those atoms. """
 
         if self.sat == pysat.lit_Undef or self.sat == pysat.lit_True:
             return None
 
         else:
             clause = []
-            for var in self.model:
-                if abs(var) in self.identifier_map:
-                    bool_var = -var
-                    clause += [bool_var]
+            for var in self.explain(self.conflict):
+                bool_var = -var
+                clause += [bool_var]
+            clause += [self.conflict]
             return clause
 
+    def independent_lemmas(self):
+        """ Returns a lemma for each disequality violated by the relation, each one forbidding
+        the equalities on the path between its sides. The duplicates and the lemmas subsumed
+        by a shorter one are left out: a complete model is cut by all of them at once. """
+
+        if self.sat != pysat.lit_False:
+            return []
+
+        lemmas = []
+        for var in self.trail:
+            if var < 0:
+                left_node, right_node = self.get_corresponding_nodes(-var)
+                if self.classes.find(left_node) == self.classes.find(right_node):
+                    lemmas.append([-atom for atom in self.explain(-var)] + [-var])
+
+        independent = []
+        for lemma in sorted(lemmas, key=len):
+            if not any(set(other) <= set(lemma) for other in independent):
+                independent.append(lemma)
+        return independent
+
+    def chord(self, i, j):
+        """ Returns an atom between the nodes i and j, created if there is none """
+
+        if equality_graph.edge(i, j) not in self.sides:
+            self.add_atom(self.new_var(), Equality(self.variables[i], self.variables[j]))
+
+        return self.sides[equality_graph.edge(i, j)]
+
+    def triangle_lemmas(self):
+        """ Explains the conflict by the triangles of the cycle it closes, cut by chords
+        (new atoms if needed). The last lemma is falsified. """
+
+        left_node, right_node = self.get_corresponding_nodes(self.conflict)
+        path = self.classes.path(left_node, right_node)
+        atoms = [self.classes.edge_reason(path[x - 1], path[x]) for x in range(1, len(path))]
+        if len(atoms) < 2:
+            return [[self.conflict] + [-atom for atom in atoms]]
+
+        lemmas = []
+        previous = atoms[0]
+        for x in range(1, len(atoms)):
+            chord = self.conflict if x == len(atoms) - 1 else self.chord(path[0], path[x + 1])
+            lemmas.append([chord, -previous, -atoms[x]])
+            previous = chord
+
+        return lemmas
+
+    def learn_clauses(self):
+        """ Called by the SAT solver after a conflict of the theory. The first literal of each
+        clause is implied by the others, and the last clause is falsified. """
+
+        if self.triangles:
+            return self.triangle_lemmas()
+        return [self.learn_clause()]
+
+
+class EufTheory(Theory):
+    """ Theory of equality with uninterpreted functions, by congruence closure over
+    hash-consed terms and a signature table """
+
+    def __init__(self, identifier_map, variables, model=None):
+
+        self.arguments = [None] * len(variables)  # (function, argument nodes) of each application node
+        self.uses = [[] for _ in variables]  # for each class, the applications with an argument in it
+        self.table = dict()  # signature -> application
+        self.atom_nodes = dict()
+        super().__init__(dict(), list(variables), model)
+        for var in identifier_map:
+            self.add_atom(var, identifier_map[var])
+
+    def node(self, term):
+        """ Returns the node of the term, created if needed """
+
+        if isinstance(term, Application):
+            key = (term.function, tuple(self.node(argument) for argument in term.arguments))
+        else:
+            key = term.identifier
+        if key not in self.index:
+            self.index[key] = self.classes.add()
+            self.variables.append(term)
+            self.disequalities.append([])
+            self.members.append([len(self.variables) - 1])
+            self.node_atoms.append([])
+            self.uses.append([])
+            self.arguments.append(key if isinstance(term, Application) else None)
+            if isinstance(term, Application):
+                u = self.index[key]
+                for argument in set(key[1]):
+                    self.add_use(self.classes.find(argument), u)
+                self.insert(u)
+        return self.index[key]
+
+    def get_corresponding_nodes(self, varname):
+        return self.atom_nodes[varname]
+
+    def add_atom(self, var, relation):
+
+        self.identifier_map[var] = relation
+        self.atom_nodes[var] = (self.node(relation.left), self.node(relation.right))
+        self.sides.setdefault(equality_graph.edge(*self.atom_nodes[var]), var)
+        self.index_atom(var)
+
+    def remove_atom(self, var):
+
+        if not super().remove_atom(var):
+            return False
+        del self.atom_nodes[var]
+        return True
+
+    def signature(self, u):
+
+        function, arguments = self.arguments[u]
+        return (function, tuple(self.classes.find(argument) for argument in arguments))
+
+    def add_use(self, root, u):
+
+        self.uses[root].append(u)
+        self.undo.append(('use', root))
+
+    def congruent(self, key, u):
+        """ Returns the application of the signature key if it is not in the class of the
+        application u yet, else None. u is put in the signature table if key is new. """
+
+        v = self.table.get(key)
+        if v is None:
+            self.undo.append(('table', key))
+            self.table[key] = u
+        elif not self.classes.same(u, v):
+            return v
+        return None
+
+    def insert(self, u):
+        """ Puts the application u in the signature table, or merges it with the application
+        that has its signature """
+
+        v = self.congruent(self.signature(u), u)
+        if v is not None:
+            self.merge(u, v, (u, v))
+
+    def merge(self, i, j, reason):
+
+        pending = [(i, j, reason)]
+        merged = False
+        while pending:
+            i, j, reason = pending.pop()
+            i_root, j_root = self.classes.find(i), self.classes.find(j)
+            if i_root == j_root:
+                continue
+            self.classes.union(i, j, reason)
+            merged = True
+
+            root = self.classes.find(i)
+            absorbed = j_root if root == i_root else i_root
+            self.merge_disequalities(root, absorbed)
+            self.merge_members(root, absorbed)
+            for u in self.uses[absorbed]:  # their signature changed
+                v = self.congruent(self.signature(u), u)
+                if v is not None:
+                    pending.append((u, v, (u, v)))
+                self.add_use(root, u)
+
+        return merged
+
+    def explain_nodes(self, i, j):
+
+        atoms = set()
+        explained = set()
+        pending = [(i, j)]
+        while pending:
+            i, j = pending.pop()
+            for reason in self.classes.explain(i, j):
+                if not isinstance(reason, tuple):
+                    atoms.add(reason)
+                elif reason not in explained:  # congruence: explained by the merges of the arguments
+                    explained.add(reason)
+                    u, v = reason
+                    for x, y in zip(self.arguments[u][1], self.arguments[v][1]):
+                        if x != y:
+                            pending.append((x, y))
+
+        return sorted(atoms)
+
+    def undo_change(self, change):
+
+        if change[0] == 'use':
+            self.uses[change[1]].pop()
+        elif change[0] == 'table':
+            del self.table[change[1]]
+        else:
+            super().undo_change(change)
+
+    def clear_relation(self):
+
+        super().clear_relation()
+        self.table = dict()
+        self.uses = [[] for _ in self.variables]
+        for u, key in enumerate(self.arguments):
+            if key is not None:
+                for argument in set(key[1]):
+                    self.add_use(argument, u)
+                self.insert(u)
+
+    def learn_clauses(self):
+        return [self.learn_clause()]
+
 
 class Solver:
+    """ Lazy offline solver: each model of the SAT solver is checked by the theory, and the
+    lemmas of its conflicts are added to the formula before the next call """
 
-    def __init__(self, identifier_map, variables):
+    def __init__(self, identifier_map, variables, preprocess=False, substitute=False):
 
         self.solver = pysat.Solver()
         self.theory = Theory(identifier_map, variables)
+        self.preprocess = preprocess
+        self.substitute = substitute
         self.res = pysat.lit_Undef
         self.model = None
         self.assertions = None
         self.formula = None
+        self.rounds = 0  # number of SAT models checked by the theory
 
     def check(self, formula):
 
         self.formula = formula.copy()
+        fixed = dict()
+        if self.substitute:
+            self.formula, fixed = self.theory.substitute(self.formula)
+            if [] in self.formula:  # The level-0 atoms are inconsistent
+                self.res = pysat.lit_False
+                self.model = []
+                return self.res
+        true_atoms = set()
+        pruned = set()
+        if self.preprocess:
+            atoms = set(self.theory.identifier_map)
+            true_atoms = set(self.theory.prune(self.formula))
+            pruned = atoms.difference(self.theory.identifier_map)
+
+        self.solver._config.verbosity = 0
+        for clause in self.formula:
+            self.solver.addClause(clause)
+        self.solver.buildDataStructure()
 
         while True:
-            self.solver = pysat.Solver()
-            self.solver._config.verbosity = 0
-            for clause in self.formula:
-                self.solver.addClause(clause)
-            self.solver.buildDataStructure()
             sat_res = self.solver.solve(None)
             if pysat.lit_False == sat_res:
                 self.res = sat_res
@@ -130,56 +721,366 @@ class Solver:
                 self.res = sat_res
                 break
             else:
+                self.rounds += 1
                 theory_res = self.theory.check(self.solver.finalModel)
                 if pysat.lit_True == theory_res:
                     self.res = theory_res
                     break
-                learnt_clause = self.theory.learn_clause()
-                self.formula += [learnt_clause]
+                for learnt_clause in self.theory.independent_lemmas():  # All the conflicts of the model at once
+                    self.formula += [learnt_clause]
+                    self.solver.addClause(learnt_clause)  # The solver keeps its learnt clauses for the next round
 
-        self.model = self.solver.finalModel
+        self.model = pruned_model(self.solver.finalModel, self.formula, pruned, true_atoms)
+        if self.substitute and self.res == pysat.lit_True:
+            self.model = substituted_model(self.model, self.formula, fixed)
         return self.res
 
 
-class CdclSolver:
+class ScopedSolver:
+    """ Base of the solvers that keep a single SAT solver over a sequence of checks.
+    push opens a scope, and pop retracts the clauses and the atoms declared in it. """
 
-    def __init__(self, identifier_map, variables):
+    dpll_t = False
+
+    def __init__(self, identifier_map, variables, triangles=False, euf=False, theory_branching=False,
+                 theory_check=None):
 
         self.solver = pysat.Solver()
-        self.theory = Theory(identifier_map, variables)
+        self.solver._config.verbosity = 0
+        self.solver._config.theoryBranching = theory_branching
         self.res = pysat.lit_Undef
         self.model = None
         self.assertions = None
         self.formula = None
+        self.to_internal = dict()
+        self.to_user = dict()  # None for the selectors and the atoms of the popped scopes
+        self.top = 0  # largest internal variable
+        self.atoms = dict()  # internal variable of each declared atom
+        self.scopes = []  # (selector, (variable, internal atom) declared in the scope) for each open scope
+        self.theory_check = theory_check
+
+        if triangles and euf:
+            raise ValueError("Triangle lemmas only explain equalities between variables")
+        self.theory = EufTheory(dict(), variables) if euf else Theory(dict(), list(variables))
+        for var in identifier_map:
+            self.theory.add_atom(self.internal(var), identifier_map[var])
+            self.atoms[var] = self.internal(var)
+        self.theory.triangles = triangles
+        self.theory.new_var = self.new_var
+
+    def internal(self, var):
+
+        if var not in self.to_internal:
+            internal = var if var not in self.to_user else self.top + 1
+            self.to_internal[var] = internal
+            self.to_user[internal] = var
+            self.top = max(self.top, internal)
+
+        return self.to_internal[var]
+
+    def internal_lit(self, lit):
+        return self.internal(lit) if lit > 0 else -self.internal(-lit)
+
+    def user_lit(self, lit):
+        """ Returns the literal of the caller, or None for a selector or a retracted atom """
+
+        var = self.to_user.get(abs(lit))
+        if var is None:
+            return None
+        return var if lit > 0 else -var
+
+    def declare(self, identifier_map):
+        """ Declares new atoms in the current scope. The atom of a variable already in use is a
+        new internal variable, equivalent to it while the scope is open """
+
+        guard = [-self.scopes[-1][0]] if self.scopes else []
+        for var in identifier_map:
+            if var in self.atoms:
+                raise ValueError("Atom already declared: " + str(var))
+            if var in self.to_internal:
+                internal = self.new_var()
+                self.solver.addClause([-internal, self.to_internal[var]] + guard)
+                self.solver.addClause([internal, -self.to_internal[var]] + guard)
+            else:
+                internal = self.internal(var)
+            self.theory.add_atom(internal, identifier_map[var])
+            self.atoms[var] = internal
+            if self.scopes:
+                self.scopes[-1][1].append((var, internal))
+
+    def new_var(self):
+        """ Returns a new internal variable, unknown to the caller """
+
+        self.top += 1
+        self.to_user[self.top] = None
+        return self.top
+
+    def push(self):
+
+        self.scopes.append((self.new_var(), []))
+
+    def pop(self):
+
+        selector, atoms = self.scopes.pop()
+        self.solver.addClause([-selector])
+        for var, internal in atoms:
+            del self.atoms[var]
+            if self.to_internal[var] == internal:  # the variable was not in use before the scope
+                del self.to_internal[var]
+            self.to_user[internal] = None
+            self.theory.remove_atom(internal)
 
     def check(self, formula):
-        self.solver._config.verbosity = 0
+
+        guard = [-self.scopes[-1][0]] if self.scopes else []
         for clause in formula:
-            self.solver.addClause(clause)
-        self.solver.buildDataStructure()
-        self.res = self.solver.solve(None, self.theory)
-        self.model = self.solver.finalModel
-        self.formula = [clause.to_list_of_ints() for clause in self.solver._clauses]
+            self.solver.addClause([self.internal_lit(lit) for lit in clause] + guard)
+        if not self.solver._built:
+            self.solver.buildDataStructure()
+
+        selectors = [selector for selector, _ in self.scopes]
+        self.res = self.solver.solve(None, self.theory, dpll_t=self.dpll_t, assumptions=selectors,
+                                     theoryCheck=self.theory_check)
+        self.model = sorted([lit for lit in map(self.user_lit, self.solver.finalModel) if lit is not None], key=abs)
+
+        open_guards = set(-selector for selector in selectors)
+        self.formula = []  # the clauses of the open scopes and the lemmas, without the selectors
+        for clause in self.solver._clauses + list(self.solver._lemmas.values()):
+            lits = [self.user_lit(lit) for lit in clause.to_list_of_ints() if lit not in open_guards]
+            if None not in lits:
+                self.formula.append(lits)
         return self.res
 
 
-class DplltSolver:
+class CdclSolver(ScopedSolver):
+    pass
+
+
+class DplltSolver(ScopedSolver):
+
+    dpll_t = True
+
 
-    def __init__(self, identifier_map, variables):
+class EncodingSolver:
+    """ Base of the eager solvers: the equality logic is encoded in clauses (by encode),
+    solved with a single call to the SAT solver """
+
+    def __init__(self, identifier_map, variables, preprocess=False, substitute=False):
 
         self.solver = pysat.Solver()
-        self.theory = Theory(identifier_map, variables)
+        self.solver._config.verbosity = 0
+        self.graph = None
+        self.polarity = None  # polarity of the atoms in the formula (see equality_graph.polarity)
+        self.preprocess = preprocess
+        self.substitute = substitute
+        self.identifier_map = identifier_map
+        self.variables = variables
         self.res = pysat.lit_Undef
         self.model = None
         self.assertions = None
         self.formula = None
 
+    def encode(self, top):
+        """ Returns the clauses to add to the formula. Their new variables are numbered
+        from top + 1. """
+        raise NotImplementedError
+
     def check(self, formula):
-        self.solver._config.verbosity = 0
+
+        top = max([abs(lit) for clause in formula for lit in clause] + list(self.identifier_map))
+        identifier_map = self.identifier_map
+        fixed = dict()
+        if self.substitute:
+            identifier_map, formula, fixed = substitute_equalities(identifier_map, formula)
+            if [] in formula:  # The level-0 atoms are inconsistent
+                self.formula = formula
+                self.res = pysat.lit_False
+                self.model = []
+                return self.res
+        self.graph = equality_graph.EqualityGraph(identifier_map, self.variables)
+        self.polarity = equality_graph.polarity(formula)
+        true_atoms = set()
+        pure = set()
+        if self.preprocess:
+            polarity = self.polarity
+            pure = self.graph.pure_atoms(polarity)
+            true_atoms = set(var for var in pure if polarity.get(var) == 1)
+            relevant = {var: relation for var, relation in identifier_map.items() if var not in pure}
+            self.graph = equality_graph.EqualityGraph(relevant, self.variables)
+        clauses = self.encode(top)
+        self.formula = formula + clauses
+
         for clause in formula:
             self.solver.addClause(clause)
         self.solver.buildDataStructure()
-        self.res = self.solver.solve(None, self.theory, dpll_t=True)
-        self.model = self.solver.finalModel
-        self.formula = [clause.to_list_of_ints() for clause in self.solver._clauses]
+        for clause in clauses:
+            self.solver.addClause(clause)  # After buildDataStructure, units already in the formula are accepted
+
+        self.res = self.solver.solve(None)
+        self.model = pruned_model([lit for lit in self.solver.finalModel if abs(lit) <= top], formula, pure, true_atoms)
+        if self.substitute and self.res == pysat.lit_True:
+            self.model = substituted_model(self.model, formula, fixed)
         return self.res
+
+
+class EagerSolver(EncodingSolver):
+    """ Transitivity encoding: the equality graph is made chordal, with a new atom for each
+    added edge, and the transitivity of each triangle of the chordal graph is added as
+    clauses. """
+
+    def __init__(self, identifier_map, variables, heuristic='min_degree', preprocess=False, substitute=False):
+
+        super().__init__(identifier_map, variables, preprocess, substitute)
+        self.heuristic = heuristic
+
+    def encode(self, top):
+
+        clauses = []
+        atoms = dict()
+        for e in self.graph.edges:
+            first = self.graph.edges[e][0]
+            atoms[e] = first
+            for var in self.graph.edges[e][1:]:  # atoms with the same sides are equivalent
+                clauses += [[-first, var], [first, -var]]
+        for var in self.graph.loops:
+            clauses += [[var]]
+
+        fill, triangles = self.graph.triangulate(self.heuristic)
+        for e in fill:
+            top += 1
+            atoms[e] = top
+
+        for v, i, j in triangles:
+            a = atoms[equality_graph.edge(v, i)]
+            b = atoms[equality_graph.edge(v, j)]
+            c = atoms[equality_graph.edge(i, j)]
+            clauses += [[-a, -b, c], [-a, -c, b], [-b, -c, a]]
+
+        return clauses
+
+
+class SmallDomainSolver(EncodingSolver):
+    """ Small domain encoding: each term variable gets the range of values allocated by
+    EqualityGraph.ranges, encoded by its bits ('log') or by a literal per value ('one_hot'),
+    and each atom is made equivalent to the comparison of the values of its sides. """
+
+    def __init__(self, identifier_map, variables, encoding='log', preprocess=False, substitute=False):
+
+        super().__init__(identifier_map, variables, preprocess, substitute)
+        if encoding not in ['log', 'one_hot']:
+            raise ValueError("Unknown encoding: " + str(encoding))
+        self.encoding = encoding
+
+    def encode(self, top):
+
+        clauses = []
+        values = dict()  # for each node, the literals of its bits or of its values
+        for i, size in self.graph.ranges(self.polarity).items():
+            width = (size - 1).bit_length() if self.encoding == 'log' else size
+            values[i] = list(range(top + 1, top + 1 + width))
+            top += width
+            if self.encoding == 'one_hot':  # exactly one value
+                clauses += [values[i]]
+                clauses += [[-a, -b] for x, a in enumerate(values[i]) for b in values[i][x + 1:]]
+
+        for var in self.graph.loops:
+            clauses += [[var]]
+
+        for (i, j), atoms in self.graph.edges.items():
+            x, y = values[i], values[j]
+            for var in atoms:
+                differences = []  # literals true when a bit differs (log)
+                for b in range(max(len(x), len(y))):
+                    if b >= len(x) or b >= len(y):  # the shorter side has 0 here
+                        lit = x[b] if b < len(x) else y[b]
+                        clauses += [[-var, -lit]]
+                        differences.append(lit)
+                    elif self.encoding == 'log':
+                        top += 1
+                        clauses += [[-var, -x[b], y[b]], [-var, x[b], -y[b]], [-top, x[b], y[b]], [-top, -x[b], -y[b]]]
+                        differences.append(top)
+                    else:
+                        clauses += [[-x[b], -y[b], var], [-var, -x[b], y[b]], [-var, -y[b], x[b]]]
+                if self.encoding == 'log':
+                    clauses += [[var] + differences]
+
+        return clauses
+
+
+def substitute_equalities(identifier_map, formula):
+    """ Substitutes the equalities of the unit clauses. Returns the new identifier_map, the
+    simplified formula, and the value of each removed atom. """
+
+    terms = dict()
+    for relation in identifier_map.values():
+        for term in [relation.left, relation.right]:
+            terms.setdefault(term.identifier, term)
+    index = dict((identifier, i) for i, identifier in enumerate(terms))
+    representatives = list(terms.values())
+    classes = union_find.UnionFind(len(representatives))
+
+    def sides(var):
+        relation = identifier_map[var]
+        return classes.find(index[relation.left.identifier]), classes.find(index[relation.right.identifier])
+
+    fixed = dict()
+    formula = [list(clause) for clause in formula]
+    while True:
+        units = set(clause[0] for clause in formula if len(clause) == 1 and abs(clause[0]) in identifier_map)
+        for lit in units:
+            if lit > 0:
+                classes.union(*sides(lit))
+        separated = set(equality_graph.edge(*sides(-lit)) for lit in units if lit < 0)
+
+        removed = dict()
+        for var in identifier_map:
+            if var not in fixed:
+                i, j = sides(var)
+                if i == j:
+                    removed[var] = True
+                elif equality_graph.edge(i, j) in separated and -var not in units:
+                    removed[var] = False  # The unit disequality itself is kept for the theory
+        if not removed:
+            break
+
+        fixed.update(removed)
+        formula = [[lit for lit in clause if abs(lit) not in fixed] for clause in formula
+                   if not any(fixed.get(abs(lit)) == (lit > 0) for lit in clause)]
+
+    simplified = []  # without the duplicate clauses, that the simplification may create
+    seen = set()
+    for clause in formula:
+        key = tuple(sorted(clause))
+        if key not in seen:
+            seen.add(key)
+            simplified.append(clause)
+    units = set(clause[0] for clause in simplified if len(clause) == 1)
+    if any(-lit in units for lit in units):
+        simplified.append([])
+
+    new_map = dict()
+    for var, relation in identifier_map.items():
+        if var not in fixed:
+            i, j = sides(var)
+            new_map[var] = type(relation)(representatives[i], representatives[j])
+
+    return new_map, simplified, fixed
+
+
+def pruned_model(model, formula, pruned, true_atoms):
+    """ Completes a model of the formula with the atoms removed by the pruning: true_atoms
+    are set to true, and the pruned atoms left out of the formula are left out of the model """
+
+    occurring = set(abs(lit) for clause in formula for lit in clause)
+    return [abs(lit) if abs(lit) in true_atoms else lit for lit in model
+            if abs(lit) in occurring or abs(lit) not in pruned]
+
+
+def substituted_model(model, formula, fixed):
+    """ Completes a model of the formula simplified by substitute_equalities with the removed
+    atoms. The atoms left out of the simplified formula are don't cares: the solvers give
+    them any value, which may not be consistent, so they are left out of the model too. """
+
+    occurring = set(abs(lit) for clause in formula for lit in clause)
+    return sorted([lit for lit in model if abs(lit) in occurring] + [var if fixed[var] else -var for var in fixed],
+                  key=abs)
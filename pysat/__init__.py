@@ -1,6 +1,7 @@
 __all__ = ['pysat']
 
 from .pysat import Solver
+from .sattheorycheck import FinalOnly, EveryFixpoint, EveryDecisions, NewAtoms, Adaptive
 
 lit_False = Solver.Constants.lit_False
 lit_True = Solver.Constants.lit_True
@@ -0,0 +1,81 @@
+""" Measures the speed of the propagation (propagations per second) on random 3-SAT instances.
+
+Usage: python -m pysat.benchPropagate [file.cnf ...]
+Without files, 5 instances are generated by genRandom.py (n=170, m=4.26n, near the threshold) in a
+temporary directory, with the seeds 0..4: the instances are the same on each run, so that two versions
+of the solver can be compared. """
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from .pysat import Solver
+
+
+def readClauses(filename):
+    """ Reads the clauses of a CNF file (as ints). A clause ends with 0 and may span several lines,
+    as in the output of genRandom.py (one literal per line) """
+    clauses = []
+    clause = []
+    for line in open(filename, 'r'):
+        if line[0] in ['c', 'p']:
+            continue
+        for l in map(int, line.split()):
+            if l == 0:
+                clauses.append(clause)
+                clause = []
+            else:
+                clause.append(l)
+    return clauses
+
+
+def generate(nbInstances, directory):
+    """ Writes nbInstances CNF files generated by genRandom.py (with the seeds 0..nbInstances-1),
+    returns their names """
+    genRandom = os.path.join(os.path.dirname(os.path.abspath(__file__)), "genRandom.py")
+    filenames = []
+    for i in range(0, nbInstances):
+        filename = os.path.join(directory, "random-{i:d}.cnf".format(i=i))
+        with open(filename, 'w') as f:
+            subprocess.run([sys.executable, genRandom, str(i)], stdout=f, check=True)
+        filenames.append(filename)
+    return filenames
+
+
+def bench(filename):
+    """ Solves the instance, returns the solver (with its statistics) """
+    solver = Solver()
+    solver._config.verbosity = 0
+    for c in readClauses(filename):
+        solver.addClause(c)
+    solver.buildDataStructure()
+    solver.solve()
+    return solver
+
+
+def main(filenames):
+    """ Solves the instances, prints the propagation speed of each and in total """
+    totPropagations = 0
+    totInspections = 0
+    totTime = 0.0
+    for filename in filenames:
+        solver = bench(filename)
+        totPropagations += solver._propagations
+        totInspections += solver._watchesInspections
+        totTime += solver._searchTime
+        print("c {f:s}: {r:s}, {p:d} propagations in {t:03.2f}s ({ps:d}/s)".format(
+            f=os.path.basename(filename), r={1: "SAT", 0: "UNSAT"}.get(solver._status, "UNKNOWN"),
+            p=solver._propagations, t=solver._searchTime, ps=int(solver._propagations / solver._searchTime)))
+    print("c Total: {p:d} propagations, {w:d} inspected watches in {t:03.2f}s".format(p=totPropagations,
+                                                                                     w=totInspections, t=totTime))
+    print("c Propagations: {ps:d}/s, inspected watches: {ws:d}/s".format(ps=int(totPropagations / totTime),
+                                                                        ws=int(totInspections / totTime)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            main(generate(5, directory))
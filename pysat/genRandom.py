@@ -1,12 +1,13 @@
-""" Generates a random CNF file """
+""" Generates a random CNF file. Usage: python genRandom.py [seed] """
 
 import random
+import sys
 
 k = 3
 n = 170
 m = int(n * 4.26)
 
-random.seed()  # Uses system time
+random.seed(int(sys.argv[1]) if len(sys.argv) > 1 else None)  # Uses system time without a seed
 for nc in range(0, m):
     c = []
     while len(c) < k:
@@ -47,6 +47,6 @@ def printWatches(solver):
         for s in range(0,2):
             l = var_to_lit(i, s)
             print(" Lit " + str(lit_to_int(l)) + " (" + str(l) + ") : " + str(len(solver._watches[l])) + " items")
-            for c in solver._watches[l]:
-                print(str(c) + "-> " + str(c.literals))
+            for c, blocker in solver._watches[l]:
+                print(str(c) + "-> " + str(c.literals) + " blocker " + str(lit_to_int(blocker)))
 
@@ -2,6 +2,8 @@ import sys
 import time
 
 from .satheapq import *
+from .satrestart import *
+from .sattheorycheck import *
 from .sattypes import *
 # My imports
 from .satutils import *
@@ -15,6 +17,7 @@ class Solver:
         lit_False = 0
         lit_True = 1
         lit_Undef = 2
+        reason_Theory = Clause([])  # Reason of the literals propagated by the theory, explained only on demand
 
     class Configuration:
         """ Contains all the configuration variables for the solver """
@@ -22,8 +25,19 @@ class Solver:
         default_value = False  # default value for branching
         verbosity = 1
         printModel = True
-        restartInc = 2  # restart interval factor (as in Minisat)
+        restartStrategy = 'geometric'  # 'geometric', 'luby' or 'glucose' (see satrestart)
+        restartFirst = 100  # number of conflicts of the first search (geometric and luby)
+        restartFactor = 1.5  # growth of the number of conflicts of each search (geometric)
+        restartInc = 2  # restart interval factor (as in Minisat), base of the luby sequence
         printLevel = 0  # 0=no prints, 1=minimum, 3=explain everything (TODO)
+        theoryBranching = False  # the theory seeds the scores of its atoms and suggests their phase
+        claDecay = 0.999  # activity decay of the learnt clauses and theory lemmas
+        firstLemmaReduce = 2000  # number of theory lemmas before the first reduction
+        lemmaReduceInc = 300  # increment of the number of lemmas kept by each reduction
+        firstReduceDB = 2000  # number of conflicts before the first reduction of the learnt clauses
+        reduceDBInc = 300  # increment of the interval between two reductions
+        lbdCore = 3  # learnt clauses with at most this LBD are never deleted
+        ccMinimization = True  # recursive minimization of the learnt clauses (as in Minisat)
 
     def __init__(self):
         self._cst = self.Constants()
@@ -33,10 +47,15 @@ class Solver:
         self._scores = MyArray('d')  # Array of doubles, score (VSIDS) of each variable (not literals)
         self._clauses = []  # Simply the list of initial clauses
         self._learnts = []  # List of learnt clauses
+        self._lemmas = dict()  # Theory lemmas, by their sorted tuple of literals (a lemma is learnt only once)
+        self._nextLemmaReduce = 0  # number of lemmas of the next reduction (set by buildDataStructure)
+        self._claInc = 1  # Amount of each clause bump (multiplied by 1/claDecay after each conflict)
+        self._nextReduceDB = 0  # number of conflicts of the next reduction (set by buildDataStructure)
         self._reason = MyList()  # self._reason[v] is the clause that propagated the literal v or -v (or None if v,
-        # -v was a decision)
-        self._watches = MyList()  # list of watched clauses by this literal
+        # -v was a decision, or reason_Theory if it was propagated by the theory)
+        self._watches = MyList()  # list of watches (clause, blocker literal) by this literal
         self._values = MyArray('b')  # Current assigned values for each variable (in Constants())
+        self._litValues = MyArray('b')  # The same for each literal, read by _valueLit and _propagate
         self._polarity = MyArray('b')  # used for the simple phase caching scheme
         self._seen = MyArray('b')  # seen array used to mark variables during conflict analysis
         self._level = MyArray('I')  # decision level of this assigned variable
@@ -44,9 +63,18 @@ class Solver:
 
         self._theory = None
         self._dpll_t = False
+        self._theoryCheck = FinalOnly()  # Policy deciding when the theory checks a partial assignment
+        self._restartPolicy = None  # Policy deciding when to restart (set by buildDataStructure)
+        self._theoryIndex = 0  # Literals in _trail (strictly) above were already sent to the theory
+        self._theoryLevel = 0  # Number of decision levels the theory knows about
+        self._seeded = set()  # Atoms of the theory whose score was seeded (see _seedScores)
 
         self.finalModel = []  # the model (if SAT) will be copied in this array of variables)
+        self.finalConflict = []  # the assumptions responsible for UNSAT (empty if UNSAT without assumptions)
+        self._assumptions = []  # literals decided first, each one at its own decision level
         self._status = self._cst.lit_Undef
+        self._built = False  # True once buildDataStructure was called: clauses are then attached when added
+        self._ok = True  # False once the clauses are proved UNSAT (at level 0)
 
         self._time0 = time.time()
         self._varHeap = SatHeapq(
@@ -55,14 +83,24 @@ class Solver:
         # statistics
         self._conflicts = 0  # total number of conflicts
         self._restarts = 0
+        self._decisions = 0
         self._propagations = 0  # total number of propagations
         self._propMoves = 0  # number of times a watched was moved
         self._watchesInspections = 0  # number of inspected clauses during propagations
+        self._blockerSkips = 0  # number of inspected clauses skipped thanks to their blocker
         self._rescaling = 0  # number of times scores were rescaled
         self._sumDecisionLevel = 0
         self._sumTrailSize = 0
         self._resolutions = 0
         self._unaryClauses = 0
+        self._theoryChecks = 0  # number of partial theory checks
+        self._theoryConflicts = 0
+        self._lemmaDuplicates = 0  # number of theory lemmas learnt again
+        self._lemmasDeleted = 0
+        self._reduceDBs = 0  # number of reductions of the learnt clauses
+        self._maxLiterals = 0  # number of literals of the learnt clauses before minimization
+        self._totLiterals = 0  # and after
+        self._learntsDeleted = 0
         self._time1 = 0.0
         self._searchTime = 0.0
 
@@ -76,12 +114,7 @@ class Solver:
 
     def _valueLit(self, l):
         """ Returns the value of the lit according to the current partial assignment """
-        v, s = lit_to_var_sign(l)
-        if self._values[v] is self._cst.lit_Undef:
-            return self._cst.lit_Undef
-        if s:
-            return self._cst.lit_False if self._values[v] is self._cst.lit_True else self._cst.lit_True
-        return self._values[v]
+        return self._litValues[l]
 
     def _pickBranchLit(self):
         """ Returns the literal on which we must branch. None if no more
@@ -94,6 +127,10 @@ class Solver:
                 break
         if v is None or self._values[v] != self._cst.lit_Undef:
             return None
+        if self._config.theoryBranching and self._theory is not None:
+            phase = self._theory.suggest_phase(var_to_int(v))  # None if the theory has no opinion
+            if phase is not None:
+                return var_to_lit(v, 0 if phase else 1)
         return var_to_lit(v, self._polarity[v])  # 1-cache scheme
 
     def _cancelUntil(self, level=0):
@@ -109,10 +146,18 @@ class Solver:
             self._polarity[v] = sign_lit(l)  # Memorizes the polarity for branching there next time the variable
             # is selected by pickbranchlit
             self._values[v] = self._cst.lit_Undef  # Simply unassign each variable
+            self._litValues[l] = self._cst.lit_Undef
+            self._litValues[not_lit(l)] = self._cst.lit_Undef
             if not self._varHeap.inHeap(v):
                 self._varHeap.insert(v)  # Put back the variable into the heap (if not already in it)
 
-        del self._trail[self._trailLevels[level] - len(self._trail):]  # shrinks the trail
+        if self._theoryLevel > level:
+            self._theory.on_backtrack(level)  # The theory undoes what it learnt at the abandoned levels
+            self._theoryLevel = level
+        self._theoryIndex = min(self._theoryIndex, self._trailLevels[level])
+        self._theoryCheck.backtracked(self, self._trailLevels[level])
+
+        del self._trail[self._trailLevels[level]:]  # shrinks the trail (the abandoned levels may be empty)
         self._trailIndexToPropagate = self._trailLevels[level]
         del self._trailLevels[level - len(self._trailLevels):]  # shrinks the traillevels
 
@@ -130,10 +175,27 @@ class Solver:
         v, s = lit_to_var_sign(l)
         assert self._values[v] == self._cst.lit_Undef  # Checks that the literal was not already assigned
         self._values[v] = self._cst.lit_False if s else self._cst.lit_True
+        self._litValues[l] = self._cst.lit_True
+        self._litValues[not_lit(l)] = self._cst.lit_False
         self._reason[v] = r
         self._level[v] = self._decisionLevel()
         self._trail.append(l)
 
+    def _seedScores(self):
+        """ Adds to the score of each atom of the theory not seeded yet its priority, scaled to [0, 1]:
+        the first decisions follow the theory, then the bumps of the conflict analysis take over """
+        priorities = self._theory.priorities()
+        top = max(list(priorities.values()) + [0])
+        if top == 0:
+            return
+        for i, priority in priorities.items():
+            v = lit_to_var(int_to_lit(i))
+            if v < self._nbvars and i not in self._seeded:
+                self._seeded.add(i)
+                self._scores[v] += priority / top
+                if self._varHeap.inHeap(v):
+                    self._varHeap.decrease(v)
+
     def _varBump(self, v):
         """Bumps the given variable, used during conflict analysis. Once in while this
            function may rescale all the scores."""
@@ -146,64 +208,106 @@ class Solver:
         if self._varHeap.inHeap(v):
             self._varHeap.decrease(v)  # This is a lazy bump: assigned variables will be replaced during cancelUntil
 
+    def _claBump(self, c):
+        """Bumps the activity of a learnt clause or theory lemma, used during conflict analysis"""
+        c.inc_score(self._claInc)
+        if c.get_score() > 1e20:  # rescale the activities
+            for l in self._learnts + list(self._lemmas.values()):
+                l.score *= 1e-20
+            self._claInc *= 1e-20
+
     def _propagate(self):
         """ Can return a conflict or None
-            This version uses 2-watched literals"""
-        while self._trailIndexToPropagate < len(self._trail):
-            self._propagations += 1
-            litToPropagate = self._trail[self._trailIndexToPropagate]
-            self._trailIndexToPropagate += 1
-
+            This version uses 2-watched literals with blockers. It is the kernel of the solver: everything
+            is bound to locals, the values are read in _litValues, and the literals of a clause in its array
+            (not_lit(l) is l ^ 1, lit_to_var(l) is l >> 1). The enqueue of _uncheckedEnqueue is inlined."""
+        lit_True = self._cst.lit_True
+        lit_False = self._cst.lit_False
+        litValues = self._litValues
+        values = self._values
+        reason = self._reason
+        level = self._level
+        watches = self._watches
+        trail = self._trail
+        decisionLevel = len(self._trailLevels)  # Every literal enqueued here is at the current level
+        qhead = self._trailIndexToPropagate
+        propagations = 0
+        inspections = 0
+        skips = 0
+        moves = 0
+        conflict = None
+        while qhead < len(trail):
+            litToPropagate = trail[qhead]
+            qhead += 1
+            propagations += 1
+            falseLit = litToPropagate ^ 1
+            wl = watches[litToPropagate]  # wl is the list of watches (clause, blocker) to inspect
             i = 0
             j = 0
-            wl = self._watches[litToPropagate]  # wl is the list of watched clauses to inspect
-            while i < len(wl):
-                self._watchesInspections += 1
-                c = wl[i]  # c is a clause containing -litToPropagate watched by it
-                foundNewWatch = False
-                assert not_lit(litToPropagate) == c[0] or not_lit(litToPropagate) == c[
-                    1]  # Strong assertion introduced in Minisat
-                assert len(c) > 1  # Clauses of size 1 are just untailed literals at level 0
-                if c[0] == not_lit(litToPropagate):  # Make sure the false literal is in 1
-                    c[0] = c[1]
-                    c[1] = not_lit(litToPropagate)  # If we find a new watch we will move it in 0
-
-                if self._valueLit(c[0]) == self._cst.lit_True:  # The clause is already satisfied (by the other watch)
-                    wl[j] = c
+            n = len(wl)  # the watches moved while inspecting wl go to other lists
+            while i < n:
+                w = wl[i]
+                i += 1
+                c, blocker = w
+                if litValues[blocker] == lit_True:  # The clause is satisfied, no need to read it
+                    skips += 1
+                    wl[j] = w
                     j += 1
-                    i += 1
                     continue
-
-                for k, l in enumerate(c[2:], 2):  # Remember that c[0] and c[1] are special
-                    if self._valueLit(l) != self._cst.lit_False:  # Found a new (free) watch for l
-                        c[k] = c[1]
-                        c[1] = l  # moves the watched literal to c[1]
-                        self._watches[not_lit(l)].append(c)  # now this clause is watched by l instead of litToPropagate
-                        self._propMoves += 1
-                        i += 1  # wl[i] will not be copied to any smaller wl[j]
-                        foundNewWatch = True  # Don't propagate anything, the clause is satisfied
-                        break  # Stop inspecting the current clause
-
-                if foundNewWatch:
+                lits = c.literals
+                if lits[0] == falseLit:  # Make sure the false literal is in 1
+                    lits[0] = lits[1]
+                    lits[1] = falseLit
+                first = lits[0]
+                if first != blocker and litValues[first] == lit_True:
+                    wl[j] = (c, first)  # The clause is satisfied by the other watch, the next blocker
+                    j += 1
                     continue
 
-                if self._valueLit(c[0]) == self._cst.lit_False:  # The clause is empty
-                    while i < len(wl):  # Copy remaining watches, preparing for a clean early exit
-                        wl[j] = wl[i]
-                        j += 1
-                        i += 1
-                    if j < i:
-                        del wl[j - i:]  # pythonic way to remove the unused tail of watched list
-                    self._trailIndexToPropagate = len(self._trail)  # No more literal to propagate
-                    return c  # the empty clause to return
-                else:  # The clause is unary (and c[1] is forced)
-                    self._uncheckedEnqueue(c[0], c)  # Enqueue it (side effect on len(self._trail))
-                    wl[j] = wl[i]
+                for k in range(2, len(lits)):  # Remember that lits[0] and lits[1] are special
+                    l = lits[k]
+                    if litValues[l] != lit_False:  # Found a new (free) watch for l
+                        lits[1] = l
+                        lits[k] = falseLit
+                        watches[l ^ 1].append((c, first))  # now this clause is watched by l
+                        moves += 1
+                        break
+                else:
+                    wl[j] = w  # The clause is still watched by litToPropagate
                     j += 1
-                    i += 1  # The clause is still watched by litToPropagate
+                    if litValues[first] == lit_False:  # The clause is empty
+                        conflict = c
+                        break
+                    else:  # The clause is unary (and lits[0] is forced)
+                        v = first >> 1
+                        litValues[first] = lit_True
+                        litValues[first ^ 1] = lit_False
+                        values[v] = lit_False if first & 1 else lit_True
+                        reason[v] = c
+                        level[v] = decisionLevel
+                        trail.append(first)
+            inspections += i
             if j < i:
-                del wl[j - i:]  # We traversed all the watches of litToPropagate, remove moved ones
-        return None
+                del wl[j:i]  # Removes the moved watches, the ones above i (after a conflict) are kept
+            if conflict is not None:
+                qhead = len(trail)  # No more literal to propagate
+                break
+        self._trailIndexToPropagate = qhead
+        self._propagations += propagations
+        self._watchesInspections += inspections
+        self._blockerSkips += skips
+        self._propMoves += moves
+        return conflict
+
+    def _reasonClause(self, v):
+        """ Returns the reason of v. The reasons of the literals propagated by the theory are
+        only asked to the theory here, when the conflict analysis needs them """
+        r = self._reason[v]
+        if r is self._cst.reason_Theory:
+            l = var_to_lit(v, 0 if self._values[v] == self._cst.lit_True else 1)
+            r = Clause([int_to_lit(i) for i in self._theory.reason(lit_to_int(l))])
+            self._reason[v] = r  # The propagated literal is in r[0], as for any other reason
+        return r
 
     def _analyze(self, c):
         """ Performs the conflict analysis. Better read an explanation somewhere for this function."""
@@ -211,11 +315,13 @@ class Solver:
         pathC = 0  # Current number of literals from the last decision level in the conflict analysis
         p = None
         index = len(self._trail) - 1
-        backtrackLevel = 0  # Keep track of the largest level in the final clause
-        maxbl = -1  # Index of the literal with the largest level (needed to put it in c[1] at the end)
         while pathC > 0 or p is None:
             if p is not None:
                 self._resolutions += 1  # p is None when we start the analysis with c
+            if c.learnt:
+                self._claBump(c)  # The learnt clauses and lemmas used in the analysis are bumped
+                if c.lbd is not None and c.lbd > self._config.lbdCore:
+                    c.lbd = min(c.lbd, self._computeLBD(c))  # It may have become a core clause
             for j in range(0 if p is None else 1, len(c)):
                 q = c[j]
                 v = lit_to_var(q)
@@ -228,24 +334,35 @@ class Solver:
                         learnt.append(
                             q)  # q is a literal in the learnt clause number of literals from the last decision level
                         # in the conflict analysis
-                        if self._level[v] > backtrackLevel:  # Updates the backtrackLevel
-                            backtrackLevel = self._level[v]  # It is the max of seen levels
-                            maxbl = len(
-                                learnt) - 1  # We need to keep its indice: we'll rearrange the clause before
-                            # backtracking
             while not self._seen[lit_to_var(self._trail[index])]:
                 index -= 1  # skip all none seen literals
             p = self._trail[index]
-            c = self._reason[lit_to_var(p)]  # c is the clause that unit propagated the literal p
+            c = self._reasonClause(lit_to_var(p))  # c is the clause that unit propagated the literal p
             # note that, by construction, all literals in c are false except p
             self._seen[lit_to_var(p)] = 0
             index -= 1
             pathC -= 1
 
         learnt[0] = not_lit(p)  # The asserting literal (FUIP, where to backtrack)
-        for lit in learnt[1:]:
+        toClear = list(learnt[1:])  # The seen tags to remove at the end
+        self._maxLiterals += len(learnt)
+        if self._config.ccMinimization:
+            abstractLevels = 0  # The levels of the learnt clause, as a (lossy) bitmask
+            for lit in learnt[1:]:
+                abstractLevels |= self._abstractLevel(lit_to_var(lit))
+            learnt = [learnt[0]] + [lit for lit in learnt[1:] if self._reason[lit_to_var(lit)] is None
+                                    or not self._litRedundant(lit, abstractLevels, toClear)]
+        self._totLiterals += len(learnt)
+        for lit in toClear:
             self._seen[lit_to_var(lit)] = 0  # remove the remaining seen tags
 
+        backtrackLevel = 0  # The largest level in the final clause
+        maxbl = -1  # Index of the literal with the largest level (needed to put it in c[1])
+        for k in range(1, len(learnt)):
+            if self._level[lit_to_var(learnt[k])] > backtrackLevel:
+                backtrackLevel = self._level[lit_to_var(learnt[k])]
+                maxbl = k
+
         if len(learnt) > 1:
             p = learnt[maxbl]
             learnt[maxbl] = learnt[1]
@@ -253,27 +370,114 @@ class Solver:
 
         return learnt, backtrackLevel
 
+    def _abstractLevel(self, v):
+        """ A bit for the level of v: two literals with different bits are at different levels """
+        return 1 << (self._level[v] & 31)
+
+    def _litRedundant(self, p, abstractLevels, toClear):
+        """ Checks if the literal p of the learnt clause is implied by the other ones, i.e. if
+        each path from p up the reasons ends in a literal of the clause (seen), or at level 0.
+        A literal at a level outside of abstractLevels cannot end in the clause: the search
+        stops there. The literals found redundant on the way are tagged seen (and added to
+        toClear), so that they are not visited again; a failed search removes its tags. """
+        stack = [p]
+        top = len(toClear)
+        while stack:
+            c = self._reasonClause(lit_to_var(stack.pop()))
+            for q in c[1:]:
+                v = lit_to_var(q)
+                if not self._seen[v] and self._level[v] > 0:
+                    if self._reason[v] is not None and (self._abstractLevel(v) & abstractLevels) != 0:
+                        self._seen[v] = 1
+                        stack.append(q)
+                        toClear.append(q)
+                    else:
+                        for lit in toClear[top:]:
+                            self._seen[lit_to_var(lit)] = 0
+                        del toClear[top:]
+                        return False
+        return True
+
+    def _computeLBD(self, lits):
+        """ Literal Block Distance: the number of distinct decision levels in the (assigned) literals """
+        return len(set(self._level[lit_to_var(l)] for l in lits))
+
+    def _analyzeFinal(self, p):
+        """ p is an assumption found false. Returns the assumptions (as ints) that imply its negation
+        in the implication graph, p included."""
+        core = [lit_to_int(p)]
+        if self._decisionLevel() == 0:
+            return core
+        self._seen[lit_to_var(p)] = 1
+
+        for x in range(len(self._trail) - 1, self._trailLevels[0] - 1, -1):
+            v = lit_to_var(self._trail[x])
+            if self._seen[v]:
+                c = self._reasonClause(v)
+                if c is None:  # A decision below the assumption levels: it is an assumption
+                    if v != lit_to_var(p):
+                        core.append(lit_to_int(self._trail[x]))
+                else:
+                    for q in c[1:]:
+                        if self._level[lit_to_var(q)] > 0:
+                            self._seen[lit_to_var(q)] = 1
+                self._seen[v] = 0
+        self._seen[lit_to_var(p)] = 0
+
+        return core
+
     def addClause(self, listOfInts):
-        """ API function to add a clause to the solver. Right now, the function
-        buildDataStructure must be called once after all the clauses have been
-        added to the solver."""
-        self._clauses.append(Clause([int_to_lit(lit) for lit in listOfInts]))
+        """ API function to add a clause to the solver. The function buildDataStructure must
+        be called once after the initial clauses have been added to the solver. Clauses added
+        after that (for instance between two calls to solve) are directly attached, and the
+        next call to solve keeps the learnt clauses, the scores and the phases."""
         self._nbvars = max(self._nbvars, max(abs(i) for i in listOfInts))
+        if not self._built:
+            self._clauses.append(Clause([int_to_lit(lit) for lit in listOfInts]))
+            return
+
+        self._cancelUntil(0)
+        self._growTo(self._nbvars)
+        lits = []
+        for l in [int_to_lit(i) for i in listOfInts]:
+            if self._valueLit(l) == self._cst.lit_True or not_lit(l) in lits:
+                return  # The clause is satisfied at level 0 (or is a tautology)
+            if l not in lits:
+                lits.append(l)
+        lits.sort(key=lambda l: self._valueLit(l) == self._cst.lit_False)  # Literals false at level 0 go last
+        c = Clause(lits)
+        self._clauses.append(c)
+
+        if len(c) == 0 or self._valueLit(c[0]) == self._cst.lit_False:
+            self._ok = False  # All the literals are false at level 0
+        elif len(c) == 1 or self._valueLit(c[1]) == self._cst.lit_False:
+            self._uncheckedEnqueue(c[0])  # The clause is unary at level 0, it will be propagated by the next search
+        else:
+            self._attachClause(c)
+
+    def _growTo(self, nbvars):
+        """ Makes room for the variables up to nbvars in the data structures """
+        first = len(self._values)
+        self._values.growTo(nbvars, self._cst.lit_Undef)
+        self._litValues.growTo(nbvars * 2, self._cst.lit_Undef)
+        for e in [self._scores, self._polarity, self._reason, self._seen, self._level]:
+            e.growTo(nbvars)
+
+        for i in range(first, nbvars):
+            self._polarity[i] = 0 if self._config.default_value else 1  # Fills the default polarity
+
+        self._watches.growTo(nbvars * 2, [])
+
+        for i in range(first, nbvars):
+            self._varHeap.insert(i)  # push all the new variables on the heap
 
     def buildDataStructure(self):
         """ Takes all the clauses sent to the solver via the addClause function and
         effectively add them to the data structure used by the solver. This function
-        must be called only once for each run."""
+        must be called only once for each solver."""
         starttime = time.time()
 
-        self._values.growTo(self._nbvars, self._cst.lit_Undef)
-        for e in [self._values, self._scores, self._polarity, self._reason, self._seen, self._level]:
-            e.growTo(self._nbvars)
-
-        for i in range(0, self._nbvars):
-            self._polarity[i] = 0 if self._config.default_value else 1  # Fills the default polarity
-
-        self._watches.growTo(self._nbvars * 2, [])
+        self._growTo(self._nbvars)
         for c in self._clauses:
             if len(c) == 1:  # Special case for unary clauses : literal is directly enqueued at decision level 0
                 if self._values[lit_to_var(c[0])] != self._cst.lit_Undef:
@@ -281,29 +485,89 @@ class Solver:
                     print("c Ooch you should use a preprocessor to clean your formula.")
                     sys.exit(1)
                 self._uncheckedEnqueue(c[0])  # FIXME I need to check here if there is a contradiction
-            for l in c[0:2]:
-                self._watches[not_lit(l)].append(c)
-
-        for i in range(0, self._nbvars):
-            self._varHeap.insert(i)  # push all the variables on the heap
+            for k, l in enumerate(c[0:2]):
+                self._watches[not_lit(l)].append((c, c[1 - k] if len(c) > 1 else l))
+        self._built = True
+        self._restartPolicy = self._newRestartPolicy()
+        self._nextReduceDB = self._config.firstReduceDB  # The configuration is read once the solver is built
+        self._nextLemmaReduce = self._config.firstLemmaReduce
 
         if self._config.verbosity > 0:
             print("c Building data structures in {t:03.2f}s".format(t=time.time() - starttime))
             print("c Ready to go with {v:d} variables and {c:d} clauses".format(v=self._nbvars,
                                                                                 c=len(self._clauses)))
 
+    def _newRestartPolicy(self):
+        """ Returns the restart policy chosen by the configuration """
+        if self._config.restartStrategy == 'geometric':
+            return Geometric(self._config.restartFirst, self._config.restartFactor)
+        if self._config.restartStrategy == 'luby':
+            return Luby(self._config.restartFirst, self._config.restartInc)
+        if self._config.restartStrategy == 'glucose':
+            return Glucose()
+        raise ValueError("Unknown restart strategy: " + str(self._config.restartStrategy))
+
     def _checkRestart(self):
-        """ Checks if a restart is needed """  # TODO (only fixed restarts strategies are implemented)
-        return False
+        """ Checks if a restart is needed (dynamic strategies) """
+        return self._restartPolicy.check(self)
 
     def _checkDBReduce(self):
-        """ Check and reduce the learnt clause database if needed """  # TODO (no cleaning strategies yet)
-        return
+        """ Check and reduce the learnt clause database if needed """
+        if self._conflicts >= self._nextReduceDB:
+            self._reduceDBs += 1
+            self._nextReduceDB = self._conflicts + self._config.firstReduceDB \
+                + self._config.reduceDBInc * self._reduceDBs
+            self._reduceDB()
+        if len(self._lemmas) >= self._nextLemmaReduce:
+            self._nextLemmaReduce += self._config.lemmaReduceInc
+            self._reduceLemmas()
+
+    def _reduceDB(self):
+        """ Deletes the less active half of the learnt clauses, except the core ones (LBD at most
+        lbdCore), the binary ones, and the ones that are the reason of a literal """
+        learnts = [c for c in self._learnts if c.lbd > self._config.lbdCore and len(c) > 2 and not self._locked(c)]
+        learnts.sort()  # by activity
+        deleted = learnts[:len(learnts) // 2]
+        self._detachAll(deleted)
+        deleted = set(map(id, deleted))
+        self._learnts = [c for c in self._learnts if id(c) not in deleted]
+        self._learntsDeleted += len(deleted)
+
+    def _locked(self, c):
+        """ A clause is locked while it is the reason of its first literal """
+        return self._reason[lit_to_var(c[0])] is c and self._valueLit(c[0]) == self._cst.lit_True
+
+    def _reduceLemmas(self):
+        """ Deletes the less active half of the theory lemmas. The binary ones are kept, and the
+        ones that are the reason of a literal too. The theory can explain them again if needed """
+        lemmas = sorted([c for c in self._lemmas.values() if len(c) > 2 and not self._locked(c)])
+        self._detachAll(lemmas[:len(lemmas) // 2])
+        for c in lemmas[:len(lemmas) // 2]:
+            del self._lemmas[tuple(sorted(c))]
+            self._lemmasDeleted += 1
 
     def _attachClause(self, c):
-        """ Attach a clause, will be watched by its 2 first literals """
-        self._watches[not_lit(c[0])].append(c)  # This will attach the clause
-        self._watches[not_lit(c[1])].append(c)  # attach clause, second watched
+        """ Attach a clause, will be watched by its 2 first literals. Each watch carries a
+        blocker, a literal of the clause (here the other watch): if it is true, the
+        propagation skips the clause without reading it """
+        self._watches[not_lit(c[0])].append((c, c[1]))  # This will attach the clause
+        self._watches[not_lit(c[1])].append((c, c[0]))  # attach clause, second watched
+
+    def _detachClause(self, c):
+        """ Detach a clause, watched by its 2 first literals """
+        for l in (not_lit(c[0]), not_lit(c[1])):
+            wl = self._watches[l]
+            for k in range(len(wl)):
+                if wl[k][0] is c:
+                    del wl[k]
+                    break
+
+    def _detachAll(self, clauses):
+        """ Detach many clauses at once: each watch list is filtered only once """
+        deleted = set(map(id, clauses))
+        for l in set(not_lit(c[k]) for c in clauses for k in (0, 1)):
+            wl = self._watches[l]
+            wl[:] = [w for w in wl if id(w[0]) not in deleted]
 
     # Simply print the search progress
     def _reportSearch(self):
@@ -313,7 +577,7 @@ class Solver:
                 cfl=self._conflicts,
                 prop=self._propagations,
                 rest=self._restarts,
-                una=self._trailLevels[0],
+                una=self._trailLevels[0] if self._trailLevels else len(self._trail),
                 unalearnts=self._unaryClauses,
                 depth=int(self._sumDecisionLevel / (1 if self._conflicts is 0 else self._conflicts)),
                 propdepth=int(self._sumTrailSize / (1 if self._conflicts is 0 else self._conflicts)),
@@ -321,20 +585,40 @@ class Solver:
 
         # The main CDCL search procedure, limited to "budget" conflicts
 
-    def _current_assignment(self):
-        current_model = []
-        for var, val in enumerate(self._values):
-            if val is not self._cst.lit_Undef:
-                lit = var_to_lit(var, 0 if val == self._cst.lit_True else 1)
-                int_var = lit_to_int(lit)
-                current_model.append(int_var)  # API: users can read the values in this array
-        return current_model
+    def _theoryAssign(self):
+        """ Sends the literals assigned since the last call to the theory, level by level.
+        Returns the result of the partial theory check (lit_False on a theory conflict)."""
+        sat = self._cst.lit_True
+        while self._theoryIndex < len(self._trail):
+            while self._theoryLevel < len(self._trailLevels) \
+                    and self._trailLevels[self._theoryLevel] <= self._theoryIndex:
+                self._theory.on_new_level()  # The next literals belong to a level the theory does not know yet
+                self._theoryLevel += 1
+            end = self._trailLevels[self._theoryLevel] if self._theoryLevel < len(self._trailLevels) \
+                else len(self._trail)
+            delta = [lit_to_int(l) for l in self._trail[self._theoryIndex:end]]
+            self._theoryIndex = end
+            if self._theory.on_assign(delta) == self._cst.lit_False:
+                sat = self._cst.lit_False
+        return sat
+
+    def _theoryPropagate(self):
+        """ Enqueues the literals implied by the theory. Returns True if at least one literal was enqueued """
+        propagated = False
+        for i in self._theory.propagate():
+            l = int_to_lit(i)
+            if lit_to_var(l) < self._nbvars and self._valueLit(l) == self._cst.lit_Undef:
+                self._uncheckedEnqueue(l, self._cst.reason_Theory)
+                propagated = True
+        return propagated
 
     def _search(self, budget=None):
         conflictC = 0  # Number of conflicts for this search
 
         while budget is None or conflictC < budget:
             confl = self._propagate()
+            if confl is None and self._theory is not None and self._theoryConflict():
+                confl = self._deduction()  # The theory lemma is analyzed like a Boolean conflict
             if confl is not None:  # We reached a conflict
                 conflictC += 1
                 self._conflicts += 1
@@ -348,59 +632,47 @@ class Solver:
                 if self._decisionLevel() is 0:
                     return self._cst.lit_False  # We proved UNSAT
 
-                nc, backtrackLevel = self._analyze(confl)  # TODO: the lbd mechanism is not implemented
+                nc, backtrackLevel = self._analyze(confl)
+                lbd = self._computeLBD(nc)  # Before backjumping, all the literals are assigned
+                self._restartPolicy.onConflict(self, lbd)
                 self._varInc /= self._config.varDecay
+                self._claInc /= self._config.claDecay
                 self._cancelUntil(backtrackLevel)
                 if len(nc) == 1:  # We don't learn unary clauses. We just push them (the above backtrackLevel is 0)
                     assert backtrackLevel is 0
                     self._unaryClauses += 1
                     self._uncheckedEnqueue(nc[0])
                 else:
-                    ncc = Clause(nc, learnt=True)
+                    ncc = Clause(nc, learnt=True, lbd=lbd)
                     self._learnts.append(ncc)
                     self._attachClause(ncc)
                     self._uncheckedEnqueue(nc[0], ncc)
-            elif self._dpll_t and self._theory is not None \
-                    and not self._theory.check(self._current_assignment()) == self._cst.lit_True:
-
-                if self._decisionLevel() <= 0:
-                    return self._cst.lit_False
-
-                ncc = self._deduction()
-                self._clauses.append(ncc)
-                self._attachClause(ncc)
-                lit = self._pickBranchLit()
-                self._newDecisionLevel()
-                self._uncheckedEnqueue(lit)
+            elif self._dpll_t and self._theory is not None and self._theoryIndex == len(self._trail) \
+                    and self._theoryPropagate():
+                continue  # The literals implied by the theory (if it knows the whole trail) are propagated first
             else:  # No conflict
                 if self._checkRestart():
                     break  # triggers a restart (dynamic strategues)
                 self._checkDBReduce()  # We may need to clean up the set of learnt clauses
 
-                l = self._pickBranchLit()  # Picks a new variable to branch on
-                if l is None:
-                    if self._theory is not None:
-
-                        current_assignment = self._current_assignment()
-                        sat = self._theory.check(current_assignment)
-
-                        if sat == self._cst.lit_True:
-                            return sat
-
-                        if self._decisionLevel() <= 0:
-                            return self._cst.lit_False
-
-                        ncc = self._deduction()
-
-                        self._clauses.append(ncc)
-                        self._attachClause(ncc)
-                        lit = self._pickBranchLit()
-                        self._newDecisionLevel()
-                        self._uncheckedEnqueue(lit)
-
+                l = None
+                while self._decisionLevel() < len(self._assumptions):
+                    p = self._assumptions[self._decisionLevel()]  # The assumptions are decided first
+                    if self._valueLit(p) == self._cst.lit_True:
+                        self._newDecisionLevel()  # Dummy decision level, p is already implied
+                    elif self._valueLit(p) == self._cst.lit_False:
+                        self.finalConflict = self._analyzeFinal(p)
+                        return self._cst.lit_False  # UNSAT under the assumptions
                     else:
-                        return self._cst.lit_True  # All variables are assigned and no conflict: SAT was proven
+                        l = p
+                        break
+
+                if l is None:
+                    l = self._pickBranchLit()  # Picks a new variable to branch on
+                if l is None:
+                    return self._cst.lit_True  # All variables are assigned and no conflict (nor theory conflict): SAT
                 else:
+                    self._decisions += 1
                     self._newDecisionLevel()  # Creates a new decision level
                     self._uncheckedEnqueue(l)  # propagates this literal with no reason (this is a decision)
 
@@ -410,38 +682,99 @@ class Solver:
         return self._cst.lit_Undef
 
     def _deduction(self):
-        nc = self._theory.learn_clause()
-        ncc = Clause([int_to_lit(int_rep) for int_rep in nc])
-        variables = [lit_to_var(lit) for lit in ncc]
-        levels = [self._level[var] for var in variables]
-        maximum = 0
-        previous_max = 0
-        for level in levels:
-            if level > maximum:
-                previous_max = maximum
-                maximum = level
-        backtrack_level = previous_max
-        self._cancelUntil(backtrack_level)
-        i = 0
-        for j, lit in enumerate(ncc):
-            if i >= 2:
-                break
-            var = lit_to_var(lit)
-            if self._values[var] == self._cst.lit_Undef:
-                lit_copy = ncc[i]
-                ncc[i] = lit
-                ncc[j] = lit_copy
-                i += 1
-        return ncc
-
-    # by default we impose a simple restart strategy (call it with maxConflicts = None for no restarts)
-    def solve(self, maxConflicts=lambda s: int((100 * (1.5 ** s._restarts))), theory=None, dpll_t=False):
+        """ Returns the theory lemma falsified by the current assignment, as a conflicting clause
+        to analyze like the Boolean ones. The solver first backtracks to the highest level in the
+        lemma. The theory may give clauses before this lemma: their first literal is implied by
+        the others, and is propagated so that the next clauses are falsified too """
+        lemmas = self._theory.learn_clauses()
+        nbvars = self._nbvars
+        self._nbvars = max([self._nbvars] + [abs(i) for nc in lemmas for i in nc])
+        self._growTo(self._nbvars)  # The theory may have created new atoms
+        if self._nbvars > nbvars and self._config.theoryBranching:
+            self._seedScores()
+
+        implied = set(abs(nc[0]) for nc in lemmas[:-1])
+        self._cancelUntil(max([0] + [self._level[lit_to_var(int_to_lit(i))] for nc in lemmas for i in nc
+                                     if abs(i) not in implied]))
+
+        for nc in lemmas:
+            if self._valueLit(int_to_lit(nc[0])) == self._cst.lit_False:
+                break  # nc is falsified: it is the lemma
+            c = self._addLemma([int_to_lit(nc[0])] + sorted([int_to_lit(int_rep) for int_rep in nc[1:]],
+                                                            key=lambda l: self._level[lit_to_var(l)], reverse=True))
+            if self._valueLit(c[0]) == self._cst.lit_Undef:
+                self._uncheckedEnqueue(c[0], c)
+
+        return self._addLemma(sorted([int_to_lit(int_rep) for int_rep in nc], key=lambda l: self._level[lit_to_var(l)],
+                                     reverse=True))  # The two literals with the highest levels will be watched
+
+    def _addLemma(self, lits):
+        """ Adds a theory lemma, watched by its two first literals. A lemma already in the store
+        is not added again: it is bumped, and watched by the two first literals of lits """
+        key = tuple(sorted(lits))
+        c = self._lemmas.get(key)
+        if c is None:
+            c = Clause(lits, learnt=True)
+            self._lemmas[key] = c
+        else:
+            self._lemmaDuplicates += 1
+            if len(c) > 1:
+                self._detachClause(c)
+            for k, l in enumerate(lits):
+                c[k] = l
+        self._claBump(c)
+        if len(c) > 1:
+            self._attachClause(c)
+        return c
+
+    def _theoryConflict(self):
+        """ Sends the new assignments to the theory. Returns True if the theory finds a conflict:
+        with the partial check when the policy _theoryCheck is ready, and with the final check
+        once all the variables are assigned """
+        if len(self._trail) < self._nbvars:
+            if not self._theoryCheck.ready(self):
+                return False
+            self._theoryChecks += 1
+            conflict = self._theoryAssign() != self._cst.lit_True
+            self._theoryCheck.checked(self, conflict)
+        else:
+            conflict = self._theoryAssign() != self._cst.lit_True or \
+                       self._theory.final_check() != self._cst.lit_True
+        if conflict:
+            self._theoryConflicts += 1
+        return conflict
+
+    # by default the restart policy of the configuration gives the budget of each search (call it with
+    # maxConflicts = None for no fixed budget: only the dynamic restarts are left)
+    def solve(self, maxConflicts=lambda s: s._restartPolicy.budget(s), theory=None, dpll_t=False,
+              assumptions=None, theoryCheck=None):
         """The solve repeatedly call the search function (each time a restart is fired,
            the search function returns lit_Undef). This function can return lit_Undef
-           if interrupted by the user."""
-        self._theory = theory
+           if interrupted by the user. The assumptions (list of ints) are decided first; if
+           they make the clauses UNSAT, finalConflict holds the assumptions responsible.
+           With dpll_t, the literals implied by the theory are propagated. theoryCheck is the
+           policy deciding when the theory checks partial assignments (see sattheorycheck):
+           by default, each fixpoint with dpll_t, and only complete assignments without."""
+        if theory is not self._theory:  # A new theory knows nothing about the current trail
+            self._theoryIndex = 0
+            self._theoryLevel = 0
+            self._theory = theory
+            self._seeded = set()
+        if theory is not None and self._config.theoryBranching and self._built:
+            self._seedScores()  # The atoms added to the theory since the last call too
         self._dpll_t = dpll_t
+        if theoryCheck is None:
+            theoryCheck = EveryFixpoint() if dpll_t else FinalOnly()
+        self._theoryCheck = theoryCheck
         self._time1 = time.time()
+        self.finalModel = []
+        self.finalConflict = []
+        self._assumptions = [int_to_lit(i) for i in assumptions] if assumptions is not None else []
+        if self._built:
+            self._growTo(max([self._nbvars] + [lit_to_var(l) + 1 for l in self._assumptions]))
+            self._nbvars = len(self._values)
+        if not self._ok:
+            return self._cst.lit_False
         try:
             self._status = self._cst.lit_Undef
             self._restarts = 0
@@ -456,8 +789,9 @@ class Solver:
 
         self._searchTime = time.time() - self._time1
 
+        if self._status == self._cst.lit_False and len(self.finalConflict) == 0:
+            self._ok = False  # UNSAT was proved at level 0, the next calls will not search again
         if self._status == self._cst.lit_True:  # We copy the solution before cancelling the decisions
-            assert len(self.finalModel) == 0
             for v, val in enumerate(self._values):
                 assert val is not self._cst.lit_Undef
                 self.finalModel.append(
@@ -478,12 +812,23 @@ class Solver:
         print("c restarts:", self._restarts)
         print("c propagations:", self._propagations, "(" + str(int(self._propagations / self._searchTime)) + "/s)")
         print("c Moved Watches:", self._propMoves)
-        print("c Inspected Watches:", self._watchesInspections)
+        print("c Inspected Watches:", self._watchesInspections, "(" + str(self._blockerSkips) + " skipped by blockers)")
         print("c VSIDS rescaling:", self._rescaling)
         print("c Avg Decision Levels: " + str(int(self._sumDecisionLevel / self._conflicts)))
         print("c Avg Trail Size: " + str(int(self._sumTrailSize / self._conflicts)))
         print("c Resolutions: {r:d} ({rc:03.2f}/confl)".format(r=self._resolutions,
                                                                rc=self._resolutions / self._conflicts))
+        print("c Conflict literals: {t:d} ({d:03.2f}% deleted)".format(
+            t=self._totLiterals, d=100 * (self._maxLiterals - self._totLiterals) / max(1, self._maxLiterals)))
+        print("c Learnt clauses: {l:d} ({d:d} deleted in {r:d} reductions)".format(l=len(self._learnts),
+                                                                                 d=self._learntsDeleted,
+                                                                                 r=self._reduceDBs))
+        if self._theory is not None:
+            print("c Theory checks: {c:d} partial, {k:d} conflicts".format(c=self._theoryChecks,
+                                                                         k=self._theoryConflicts))
+            print("c Theory lemmas: {l:d} ({d:d} learnt again, {x:d} deleted)".format(l=len(self._lemmas),
+                                                                                     d=self._lemmaDuplicates,
+                                                                                     x=self._lemmasDeleted))
 
 
 # when running as a solver:
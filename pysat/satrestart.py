@@ -0,0 +1,75 @@
+from .satboundedqueue import *
+from .satutils import *
+
+
+# Restart policies, selected by Configuration.restartStrategy. A policy gives the conflict
+# budget of each search (budget, None for no fixed limit), and can fire a dynamic restart
+# between two decisions (check). It is told the LBD of each learnt clause (onConflict).
+
+class Geometric:
+    """ The budget of the k-th search is first * factor^k conflicts """
+
+    def __init__(self, first=100, factor=1.5):
+        self._first = first
+        self._factor = factor
+
+    def budget(self, solver):
+        return int(self._first * (self._factor ** solver._restarts))
+
+    def onConflict(self, solver, lbd):
+        return
+
+    def check(self, solver):
+        return False
+
+
+class Luby:
+    """ The budget of the k-th search is first * luby(base, k) conflicts (as in Minisat): the
+    short searches are the most frequent, and each length is tried twice before doubling """
+
+    def __init__(self, first=100, base=2):
+        self._first = first
+        self._base = base
+
+    def budget(self, solver):
+        return int(self._first * luby(self._base, solver._restarts - 1))
+
+    def onConflict(self, solver, lbd):
+        return
+
+    def check(self, solver):
+        return False
+
+
+class Glucose:
+    """ Dynamic restarts (as in Glucose): the search restarts when the recent learnt clauses
+    are worse than the average ones, i.e. when the average LBD of the last lbdSize conflicts,
+    times K, is above the global average. A restart is blocked when the trail is much larger
+    (by R) than its recent average: the solver may be close to a model. """
+
+    def __init__(self, K=0.8, R=1.4, lbdSize=50, trailSize=5000, blockAfter=10000):
+        self._K = K
+        self._R = R
+        self._blockAfter = blockAfter  # number of conflicts before the restarts can be blocked
+        self._lbdQueue = SatBoundedQueue(lbdSize)
+        self._trailQueue = SatBoundedQueue(trailSize)
+        self._sumLBD = 0
+        self._conflicts = 0
+
+    def budget(self, solver):
+        return None
+
+    def onConflict(self, solver, lbd):
+        self._conflicts += 1
+        self._sumLBD += lbd
+        self._trailQueue.append(len(solver._trail))
+        if self._conflicts > self._blockAfter and self._lbdQueue.isValid() \
+                and len(solver._trail) > self._R * self._trailQueue.getAvg():
+            self._lbdQueue.fastClear()  # blocks the restart
+        self._lbdQueue.append(lbd)
+
+    def check(self, solver):
+        if not self._lbdQueue.isValid() or self._lbdQueue.getAvg() * self._K <= self._sumLBD / self._conflicts:
+            return False
+        self._lbdQueue.fastClear()
+        return True
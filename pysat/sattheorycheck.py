@@ -0,0 +1,101 @@
+from .sattypes import *
+
+
+# Policies deciding when the solver runs the partial theory check (Theory.on_assign) before
+# the trail is complete. Once all the variables are assigned, the theory is always checked.
+# A policy is asked ready(solver) at each fixpoint of the Boolean propagation, and is told
+# the result of each partial check by checked(solver, conflict), and of the size of the trail
+# after each backjump by backtracked(solver, size).
+
+class FinalOnly:
+    """ The theory only checks complete assignments (lazy, offline check) """
+
+    def ready(self, solver):
+        return False
+
+    def checked(self, solver, conflict):
+        return
+
+    def backtracked(self, solver, size):
+        return
+
+
+class EveryFixpoint:
+    """ The theory checks each fixpoint of the Boolean propagation (DPLL(T)) """
+
+    def ready(self, solver):
+        return True
+
+    def checked(self, solver, conflict):
+        return
+
+    def backtracked(self, solver, size):
+        return
+
+
+class EveryDecisions:
+    """ The theory checks the assignment once every k decisions """
+
+    def __init__(self, k=4):
+        self._k = k
+        self._lastCheck = -k  # number of decisions of the solver at the last check
+
+    def ready(self, solver):
+        return solver._decisions - self._lastCheck >= self._k
+
+    def checked(self, solver, conflict):
+        self._lastCheck = solver._decisions
+
+    def backtracked(self, solver, size):
+        return
+
+
+class NewAtoms:
+    """ The theory checks the assignment only when it has new atoms to read: the other
+    literals of the trail (Tseitin variables, selectors...) cannot make it inconsistent.
+    The theory must tell its atoms apart with is_atom(int)."""
+
+    def __init__(self):
+        self._scanned = 0  # The literals of the trail (strictly) below hold no atom unknown to the theory
+
+    def ready(self, solver):
+        x = max(solver._theoryIndex, self._scanned)
+        while x < len(solver._trail):
+            if solver._theory.is_atom(var_to_int(lit_to_var(solver._trail[x]))):
+                return True
+            x += 1
+        self._scanned = x
+        return False
+
+    def checked(self, solver, conflict):
+        return
+
+    def backtracked(self, solver, size):
+        self._scanned = min(self._scanned, size)  # The literals above were undone
+
+
+class Adaptive:
+    """ The theory checks the assignment at a rate driven by the recent theory conflicts:
+    the partial checks that find a conflict prune the search, the others are overhead.
+    rate is a moving average of the checks that found a conflict. Above target, the theory
+    checks each fixpoint, and below, it skips the fixpoints until skip decisions were made,
+    up to maxSkip when the checks never find a conflict. """
+
+    def __init__(self, target=0.1, maxSkip=16, decay=0.9):
+        self._target = target
+        self._maxSkip = maxSkip
+        self._decay = decay
+        self.rate = target  # Starts as DPLL(T)
+        self.skip = 0
+        self._lastCheck = 0
+
+    def ready(self, solver):
+        return solver._decisions - self._lastCheck >= self.skip
+
+    def checked(self, solver, conflict):
+        self._lastCheck = solver._decisions
+        self.rate = self._decay * self.rate + (1 - self._decay) * (1 if conflict else 0)
+        self.skip = round((1 - min(1.0, self.rate / self._target)) * self._maxSkip)
+
+    def backtracked(self, solver, size):
+        return
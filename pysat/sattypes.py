@@ -69,8 +69,8 @@ class Clause:
     def contains_literal(self, lit):
         return self.literals.contains(lit)
 
-    def inc_score(self):
-        self.score += self.var_inc
+    def inc_score(self, inc=None):
+        self.score += self.var_inc if inc is None else inc
 
     def get_score(self):
         return self.score
@@ -231,6 +231,14 @@ def complicated_tseitin_case():
     return identifier_map, variables, formula, sat
 
 
+def check_cases(test, new_solver):
+    """ Checks the answer of new_solver(identifier_map, variables) on each of the cases above """
+
+    for case in [simple_sat_case, simple_unsat_case, basic_sat_case, complicated_tseitin_case]:
+        identifier_map, variables, formula, sat = case()
+        test.assertEqual(sat, new_solver(identifier_map, variables).check(formula), "SAT is incorrect: " + case.__name__)
+
+
 class LazyBasicTestCase(unittest.TestCase):
 
     def test_simple_case(self):
@@ -251,7 +259,7 @@ class LazyBasicTestCase(unittest.TestCase):
 
         self.assertEqual(sat, s.res, "SAT is incorrect")
         self.assertListEqual([], s.model, "Model is incorrect")
-        self.assertListEqual([[1], [2], [3], [-4], [-1, -2, -3, 4]], s.formula, "Formula is incorrect")
+        self.assertListEqual([[1], [2], [3], [-4], [-3, -2, -1, 4]], s.formula, "Formula is incorrect")
 
     def test_case(self):
         identifier_map, variables, formula, sat = basic_sat_case()
@@ -266,9 +274,8 @@ class LazyBasicTestCase(unittest.TestCase):
              [2, -3, -4],
              [5, 4],
              [-2, 6],
-             [-1, 2, 3, -4, 5, 6],
-             [-1, 2, 3, -4, -5, 6],
-             [-1, 2, 3, 4, -5, 6]],
+             [-4, -1, 2],
+             [-5, -1, 3]],
             s.formula, "Formula is incorrect")
 
     def test_complicated_with_tseitin(self):
@@ -281,7 +288,7 @@ class LazyBasicTestCase(unittest.TestCase):
         self.assertListEqual(
             [1, -2, 3, -4, 5,
              -6, -7, -8, -9, -10,
-             11, 12, 13, -14, -15,
+             -11, 12, 13, -14, -15,
              -16, -17, -18], s.model, "Model is incorrect")
         self.assertListEqual(
             [[12],
@@ -319,22 +326,7 @@ class LazyBasicTestCase(unittest.TestCase):
              [-18, 7],
              [-18, 11],
              [-18, -8],
-             [-1, 2, -3, 4, -5, 6, 7, 8, -9, 10, 11],
-             [-1, 2, -3, 4, -5, 6, 7, -8, -9, 10, 11],
-             [-1, 2, -3, 4, -5, 6, -7, -8, -9, 10, 11],
-             [-1, 2, -3, 4, -5, 6, -7, 8, -9, 10, 11],
-             [-1, 2, -3, 4, -5, 6, -7, 8, -9, -10, 11],
-             [-1, 2, -3, 4, -5, 6, 7, 8, -9, -10, 11],
-             [-1, 2, -3, 4, -5, 6, 7, -8, -9, -10, 11],
-             [-1, 2, -3, 4, -5, 6, -7, -8, -9, -10, 11],
-             [-1, 2, -3, 4, -5, 6, -7, -8, -9, -10, -11],
-             [-1, 2, -3, 4, -5, 6, -7, 8, -9, -10, -11],
-             [-1, 2, -3, 4, -5, 6, -7, 8, -9, 10, -11],
-             [-1, 2, -3, 4, -5, 6, -7, -8, -9, 10, -11],
-             [-1, 2, -3, 4, -5, 6, 7, -8, -9, 10, -11],
-             [-1, 2, -3, 4, -5, 6, 7, -8, -9, -10, -11],
-             [-1, 2, -3, 4, -5, 6, 7, 8, -9, -10, -11],
-             [-1, 2, -3, 4, -5, 6, 7, 8, -9, 10, -11]],
+             [-3, -9, 2]],
             s.formula, "Formula is incorrect")
 
 
@@ -358,7 +350,7 @@ class LazyCdclTestCase(unittest.TestCase):
 
         self.assertEqual(sat, s.res, "SAT is incorrect")
         self.assertListEqual([], s.model, "Model is incorrect")
-        self.assertListEqual([[1], [2], [3], [-4]], s.formula, "Formula is incorrect")
+        self.assertListEqual([[1], [2], [3], [-4], [-3, -2, -1, 4]], s.formula, "Formula is incorrect")
 
     def test_case(self):
         identifier_map, variables, formula, sat = basic_sat_case()
@@ -373,9 +365,8 @@ class LazyCdclTestCase(unittest.TestCase):
              [-4, -3, 2],
              [5, 4],
              [-2, 6],
-             [5, -4, -1, 2, 3, 6],
-             [2, -4, 3, -1, -5, 6],
-             [3, 4, -1, 2, -5, 6]],
+             [-4, 2, -1],
+             [3, -5, -1]],
             s.formula, "Formula is incorrect")
 
     def test_complicated_with_tseitin(self):
@@ -387,64 +378,46 @@ class LazyCdclTestCase(unittest.TestCase):
         self.assertEqual(sat, s.res, "SAT is incorrect")
         self.assertListEqual(
             [1, -2, 3, -4, 5,
-             -6, 7, 8, -9, -10,
-             11, 12, 13, -14, -15,
+             -6, -7, -8, -9, -10,
+             -11, 12, 13, -14, -15,
              -16, -17, -18], s.model, "Model is incorrect")
         self.assertListEqual(
             [[12],
              [13, 14, -12],
-             [1, -13],
-             [3, -13],
+             [-13, 1],
+             [-13, 3],
              [5, -13],
-             [-2, -13],
+             [-13, -2],
              [-4, -13],
              [-6, -13],
              [-14, 16, 15],
-             [1, -15],
-             [-15, 3],
-             [-15, 5],
+             [-15, 1],
+             [3, -15],
+             [5, -15],
              [-2, -15],
              [-4, -15],
-             [-15, -6],
-             [-15, 9],
-             [-16, 17, 18],
-             [1, -17],
-             [3, -17],
-             [5, -17],
-             [-2, -17],
-             [-4, -17],
-             [-6, -17],
-             [7, -17],
-             [8, -17],
+             [-6, -15],
+             [9, -15],
+             [-16, 18, 17],
+             [-17, 1],
+             [-17, 3],
+             [-17, 5],
+             [-17, -2],
+             [-17, -4],
+             [-17, -6],
+             [-17, 7],
+             [-17, 8],
              [-17, 10],
-             [1, -18],
-             [3, -18],
-             [5, -18],
-             [-2, -18],
-             [-4, -18],
-             [-6, -18],
-             [7, -18],
-             [11, -18],
+             [-18, 1],
+             [-18, 3],
+             [-18, 5],
+             [-18, -2],
+             [-18, -4],
+             [-18, -6],
+             [-18, 7],
+             [-18, 11],
              [-18, -8],
-             [-9, 10, 2, 4, 6, -3, 8, -1, -5, 11, 7],
-             [7, -8, -3, 4, -5, 6, -1, 2, -9, 10, 11],
-             [11, -8, -3, 4, -5, 6, 7, -10, -9, -1, 2],
-             [7, -10, -3, 4, -5, 6, -8, -11, -9, -1, 2],
-             [7, -8, -3, 4, -5, 6, -11, 10, -9, -1, 2],
-             [-9, -10, -11, 4, -5, -3, -7, 6, -8, -1, 2],
-             [11, -8, -3, 4, -5, 6, -7, -10, -9, -1, 2],
-             [11, -8, -3, 4, -5, 6, 10, -7, -9, -1, 2],
-             [-9, 10, -11, 4, -5, -3, 6, -7, -8, -1, 2],
-             [-9, 10, 2, 4, 6, -3, -7, 8, -5, 11, -1],
-             [-9, 10, -11, 4, 6, -3, -1, 8, -5, 2, -7],
-             [7, 10, -3, 4, -5, 6, -1, 8, -9, 2, -11],
-             [7, -3, -11, 4, -5, 6, -10, 8, -9, -1, 2],
-             [7, 11, -3, 4, -5, 6, -10, 8, -9, -1, 2],
-             [-9, -10, -11, 4, 2, 6, -7, 8, -3, -5, -1],
-             [11, -10, -3, 4, -5, 6, -7, 8, -9, -1, 2],
-             [2, 8, -3, 4, -5, 6, -7, 10, 9, -1, -11],
-             [8, -10, -1, 4, 2, -5, -7, -3, 6, 9, -11],
-             [2, -10, -3, 4, -5, 6, -7, -8, 9, -1, -11]],
+             [-9, -3, 2]],
             s.formula, "Formula is incorrect")
 
 
@@ -468,7 +441,7 @@ class DplltTestCase(unittest.TestCase):
 
         self.assertEqual(sat, s.res, "SAT is incorrect")
         self.assertListEqual([], s.model, "Model is incorrect")
-        self.assertListEqual([[1], [2], [3], [-4]], s.formula, "Formula is incorrect")
+        self.assertListEqual([[1], [2], [3], [-4], [-3, -2, -1, 4]], s.formula, "Formula is incorrect")
 
     def test_case(self):
         identifier_map, variables, formula, sat = basic_sat_case()
@@ -482,10 +455,7 @@ class DplltTestCase(unittest.TestCase):
             [[1],
              [-4, -3, 2],
              [5, 4],
-             [-2, 6],
-             [5, 3, -1, 2, -4, 6],
-             [-4, 3, -1, 2, -5, 6],
-             [3, 4, -1, 2, -5, 6]],
+             [-2, 6]],
             s.formula, "Formula is incorrect")
 
     def test_complicated_with_tseitin(self):
@@ -503,21 +473,21 @@ class DplltTestCase(unittest.TestCase):
         self.assertListEqual(
             [[12],
              [13, 14, -12],
-             [1, -13],
-             [3, -13],
+             [-13, 1],
+             [-13, 3],
              [5, -13],
              [-2, -13],
              [-4, -13],
              [-6, -13],
              [-14, 16, 15],
-             [1, -15],
+             [-15, 1],
              [3, -15],
              [5, -15],
              [-2, -15],
              [-4, -15],
-             [-15, -6],
-             [-15, 9],
-             [-16, 18, 17],
+             [-6, -15],
+             [9, -15],
+             [-16, 17, 18],
              [-17, 1],
              [-17, 3],
              [-17, 5],
@@ -536,9 +506,421 @@ class DplltTestCase(unittest.TestCase):
              [-18, 7],
              [-18, 11],
              [-18, -8],
-             [-9, 4, -1, 6, -5, 2, -3]],
+             [-9, 2, -3]],
             s.formula, "Formula is incorrect")
 
 
+class EagerTestCase(unittest.TestCase):
+
+    def test_simple_case(self):
+        identifier_map, variables, formula, sat = simple_sat_case()
+
+        s = eq.EagerSolver(identifier_map, variables)
+
+        self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+        self.assertListEqual([1, 2, 3], s.model, "Model is incorrect")
+        self.assertListEqual(formula, s.formula, "A tree needs no transitivity clause")
+
+    def test_unsat_case(self):
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        s = eq.EagerSolver(identifier_map, variables)
+
+        self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+        self.assertEqual(len(formula) + 6, len(s.formula), "The cycle needs one chord and two triangles")
+
+    def test_case(self):
+        identifier_map, variables, formula, sat = basic_sat_case()
+
+        s = eq.EagerSolver(identifier_map, variables)
+
+        self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+        self.assertListEqual([1, -2, 3, -4, 5, -6], s.model, "Model is incorrect")
+
+    def test_complicated_with_tseitin(self):
+        identifier_map, variables, formula, sat = complicated_tseitin_case()
+
+        for heuristic in ['min_degree', 'min_fill']:
+            s = eq.EagerSolver(identifier_map, variables, heuristic)
+
+            self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+            self.assertEqual(18, len(s.model), "Model should not contain the chord atoms")
+
+
+class SmallDomainTestCase(unittest.TestCase):
+
+    def test_domain_size(self):
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        for encoding, size in [('log', 5), ('one_hot', 7)]:
+            s = eq.SmallDomainSolver(identifier_map, variables, encoding)
+
+            self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+            self.assertDictEqual({0: 1, 1: 2, 2: 2, 3: 2}, s.graph.ranges(s.polarity),
+                                 "Only x4 != x1 can be false: two values are enough")
+            self.assertEqual(size, len(set(abs(lit) for clause in s.formula for lit in clause if abs(lit) > 4)),
+                             "Number of new variables is incorrect")
+            check_cases(self, lambda identifier_map, variables: eq.SmallDomainSolver(identifier_map, variables,
+                                                                                     encoding))
+
+    def test_case(self):
+        identifier_map, variables, formula, sat = basic_sat_case()
+
+        s = eq.SmallDomainSolver(identifier_map, variables, 'log')
+
+        self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+        self.assertListEqual([1, 2, 3, 4, 5, 6], s.model, "Model is incorrect")
+
+    def test_unknown_encoding(self):
+        identifier_map, variables, formula, sat = basic_sat_case()
+
+        self.assertRaises(ValueError, eq.SmallDomainSolver, identifier_map, variables, 'unary')
+
+
+class PreprocessTestCase(unittest.TestCase):
+
+    def test_simple_case(self):
+        identifier_map, variables, formula, sat = simple_sat_case()
+
+        s = eq.Solver(identifier_map, variables, preprocess=True)
+
+        self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+        self.assertDictEqual({}, s.theory.identifier_map, "A tree has no conflict to check")
+        self.assertListEqual([], s.theory.variables, "Isolated variables should be dropped")
+        self.assertEqual(3, len(identifier_map), "The map of the caller should not be modified")
+
+    def test_positive_cycle(self):
+        x1, x2, x3, x4 = eq.Variable('x1'), eq.Variable('x2'), eq.Variable('x3'), eq.Variable('x4')
+        identifier_map = {1: eq.Equality(x1, x2), 2: eq.Equality(x2, x3), 3: eq.Equality(x3, x1),
+                          4: eq.Equality(x3, x4)}
+        formula = [[1, -4], [2, -4], [3, 4]]
+
+        for s in [eq.Solver(identifier_map, [x1, x2, x3, x4], preprocess=True),
+                  eq.EagerSolver(identifier_map, [x1, x2, x3, x4], preprocess=True)]:
+            self.assertEqual(pysat.lit_True, s.check(formula), "SAT is incorrect")
+            self.assertListEqual([1, 2, 3], s.model[:3], "Atoms with positive polarity only should be true")
+
+    def test_model_is_consistent(self):
+        x0, x1, x2 = eq.Variable('x0'), eq.Variable('x1'), eq.Variable('x2')
+        identifier_map = {1: eq.Equality(x2, x1), 2: eq.Equality(x1, x0), 3: eq.Equality(x1, x0)}
+        formula = [[3, -4]]
+
+        for s in [eq.Solver(identifier_map, [x0, x1, x2], preprocess=True),
+                  eq.EagerSolver(identifier_map, [x0, x1, x2], preprocess=True),
+                  eq.SmallDomainSolver(identifier_map, [x0, x1, x2], 'log', preprocess=True)]:
+            self.assertEqual(pysat.lit_True, s.check(formula), "SAT is incorrect")
+            self.assertIn(3, s.model, "Atoms with positive polarity only should be true")
+            atoms = [lit for lit in s.model if abs(lit) in identifier_map]
+            self.assertEqual(pysat.lit_True, eq.Theory(identifier_map, [x0, x1, x2]).check(atoms),
+                             "Model is inconsistent")
+
+    def test_unsat_case(self):
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        s = eq.Solver(identifier_map, variables, preprocess=True)
+
+        self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+        self.assertEqual(4, len(s.theory.identifier_map), "The cycle can be a conflict")
+
+    def test_substitution(self):
+        identifier_map, variables, formula, sat = basic_sat_case()
+
+        substituted, simplified, fixed = eq.substitute_equalities(identifier_map, formula)
+        self.assertDictEqual({1: True}, fixed, "x1 == x4 holds at level 0")
+        self.assertListEqual([[2, -3, -4], [5, 4], [-2, 6]], simplified, "Formula is incorrect")
+        self.assertEqual(['x2', 'x1'], [substituted[4].left.identifier, substituted[4].right.identifier],
+                         "x4 should be replaced by x1")
+
+        for s in [eq.Solver(identifier_map, variables, substitute=True),
+                  eq.EagerSolver(identifier_map, variables, substitute=True)]:
+            self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+            self.assertListEqual([1, -2, 3, -4, 5, -6], s.model, "Model is incorrect")
+
+    def test_substitution_conflict(self):
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        s = eq.Solver(identifier_map, variables, substitute=True)
+
+        self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+        self.assertListEqual([[]], s.formula, "x4 != x1 should be falsified at level 0")
+        self.assertEqual(0, s.rounds, "The SAT solver should not be called")
+
+
+def euf_case():
+    """
+    x1 == x2, f(f(x1)) == f(f(x2)), x2 == x3, g(x1, x3) == g(x2, x1)
+    b1, b2, b3, b4
+    """
+
+    x1 = eq.Variable('x1')
+    x2 = eq.Variable('x2')
+    x3 = eq.Variable('x3')
+
+    variables = [x1, x2, x3]
+
+    varb1 = eq.Equality(x1, x2)
+    varb2 = eq.Equality(eq.Application('f', eq.Application('f', x1)), eq.Application('f', eq.Application('f', x2)))
+    varb3 = eq.Equality(x2, x3)
+    varb4 = eq.Equality(eq.Application('g', x1, x3), eq.Application('g', x2, x1))
+
+    identifier_map = \
+        {1: varb1, 2: varb2, 3: varb3, 4: varb4}
+
+    return identifier_map, variables
+
+
+class EufTestCase(unittest.TestCase):
+
+    def test_congruence_conflict(self):
+        identifier_map, variables = euf_case()
+
+        t = eq.EufTheory(identifier_map, variables)
+
+        self.assertEqual(pysat.lit_False, t.on_assign([1, -2]), "f(f(x1)) and f(f(x2)) should be congruent")
+        self.assertListEqual([-1, 2], t.learn_clause(), "Lemma is incorrect")
+
+    def test_propagation(self):
+        identifier_map, variables = euf_case()
+
+        t = eq.EufTheory(identifier_map, variables)
+        t.on_assign([1])
+        t.on_new_level()
+        t.on_assign([3])
+
+        self.assertListEqual([2, 4], t.propagate(), "Implied atoms are incorrect")
+        self.assertListEqual([4, -1, -3], t.reason(4), "Reason of g(x1, x3) == g(x2, x1) is incorrect")
+
+        t.on_backtrack(0)
+        self.assertListEqual([2], t.propagate(), "Congruences of level 1 should be undone")
+
+    def test_solvers(self):
+        identifier_map, variables = euf_case()
+
+        for solver_class in [eq.CdclSolver, eq.DplltSolver]:
+            s = solver_class(identifier_map, variables, euf=True)
+
+            self.assertEqual(pysat.lit_True, s.check([[1], [-4, -2]]), "SAT is incorrect")
+            self.assertListEqual([1, 2, -3, -4], s.model, "Model is incorrect")
+
+            s.push()
+            self.assertEqual(pysat.lit_False, s.check([[3]]), "SAT is incorrect")
+            s.pop()
+            self.assertEqual(pysat.lit_True, s.check([]), "SAT is incorrect")
+
+
+class TheoryTestCase(unittest.TestCase):
+
+    def test_incremental_protocol(self):
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        t = eq.Theory(identifier_map, variables)
+
+        self.assertEqual(pysat.lit_True, t.on_assign([1, -4]), "Level 0 should be consistent")
+        t.on_new_level()
+        self.assertEqual(pysat.lit_True, t.on_assign([2]), "Level 1 should be consistent")
+        t.on_new_level()
+        self.assertEqual(pysat.lit_False, t.on_assign([3]), "Level 2 should be inconsistent")
+
+        t.on_backtrack(1)
+        self.assertListEqual([1, -4, 2], t.trail, "Trail is incorrect after backtracking")
+        self.assertEqual(pysat.lit_True, t.final_check(), "Conflict should be undone")
+        self.assertEqual(pysat.lit_True, t.on_assign([-3]), "Level 1 should be consistent")
+
+    def test_independent_lemmas(self):
+        x = [eq.Variable('x' + str(i)) for i in range(1, 7)]
+        identifier_map = {1: eq.Equality(x[0], x[1]), 2: eq.Equality(x[1], x[2]), 3: eq.Equality(x[0], x[2]),
+                          4: eq.Equality(x[3], x[4]), 5: eq.Equality(x[4], x[5]), 6: eq.Equality(x[3], x[5]),
+                          7: eq.Equality(x[2], x[0])}
+        formula = [[1], [2], [-3], [4], [5], [-6], [-7]]
+
+        t = eq.Theory(identifier_map, x)
+        self.assertEqual(pysat.lit_False, t.check([1, 2, -3, 4, 5, -6, -7]), "Theory check is incorrect")
+        self.assertListEqual([[-2, -1, 3], [-5, -4, 6], [-2, -1, 7]], t.independent_lemmas(),
+                             "Lemmas are incorrect")
+
+        s = eq.Solver(identifier_map, x)
+        self.assertEqual(pysat.lit_False, s.check(formula), "SAT is incorrect")
+        self.assertEqual(1, s.rounds, "Both conflicts should be learnt in one round")
+
+    def test_disequality_index(self):
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        t = eq.Theory(identifier_map, variables)
+        t.on_assign([-4])
+        t.on_new_level()
+        t.on_assign([1, 2])
+
+        root = t.classes.find(0)
+        self.assertListEqual([4], t.disequalities[root], "Index of x1 is incorrect")
+        self.assertListEqual([4], t.disequalities[t.classes.find(3)], "Index of x4 is incorrect")
+
+        self.assertEqual(pysat.lit_False, t.on_assign([3]), "Merge should find x1 != x4")
+        self.assertEqual(4, t.conflict, "Conflict is incorrect")
+
+        t.on_backtrack(0)
+        self.assertListEqual([[4], [], [], [4]], t.disequalities, "Index should be restored")
+        self.assertEqual(pysat.lit_True, t.final_check(), "Conflict should be undone")
+
+    def test_propagation(self):
+        identifier_map, variables, formula, sat = basic_sat_case()
+
+        t = eq.Theory(identifier_map, variables)
+        t.on_assign([1, 2, -5])
+
+        self.assertListEqual([-3, 4, -6], t.propagate(), "Implied atoms are incorrect")
+        self.assertListEqual([], t.propagate(), "Implied atoms should be sent only once")
+        self.assertListEqual([4, -1, -2], t.reason(4), "Reason of x2 == x4 is incorrect")
+        self.assertListEqual([-3, 5, -1], t.reason(-3), "Reason of x1 != x3 is incorrect")
+
+        t = eq.Theory(identifier_map, variables)
+        t.on_assign([1, 2, -5])
+        t.on_new_level()
+        t.on_backtrack(0)
+        self.assertListEqual([-3, 4, -6], t.propagate(), "Atoms implied at the remaining levels should be kept")
+
+    def test_branching(self):
+        identifier_map, variables, formula, sat = simple_sat_case()
+
+        t = eq.Theory(identifier_map, variables)
+        self.assertDictEqual({1: 1, 2: 2, 3: 1}, t.priorities(), "Priorities are incorrect")
+
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        t = eq.Theory(identifier_map, variables)
+        t.on_assign([-4])
+        t.on_new_level()
+        t.on_assign([1])
+
+        self.assertListEqual([True, False, False, False, None], [t.suggest_phase(var) for var in range(1, 6)],
+                             "Phases are incorrect")
+        t.on_backtrack(0)
+        self.assertIsNone(t.suggest_phase(2), "Phase of x2 == x3 should be free")
+
+    def test_branching_decisions(self):
+        x = [eq.Variable('x' + str(i)) for i in range(6)]
+        identifier_map = {1: eq.Equality(x[0], x[1]), 2: eq.Equality(x[1], x[2]), 3: eq.Equality(x[2], x[3]),
+                          4: eq.Equality(x[2], x[4])}
+
+        for branching, model in [(False, [-1, 2]), (True, [1, -2])]:
+            s = eq.DplltSolver(dict(identifier_map), x[:5], theory_branching=branching)
+            s.check([[1, 2]])
+            self.assertListEqual(model, s.model, "Atom 2, of highest priority, should be decided first")
+
+        for branching, model in [(False, [1, 2, -3]), (True, [-1, -2, -3])]:
+            s = eq.DplltSolver(dict(identifier_map), x[:5], theory_branching=branching)
+            s.solver._config.default_value = True
+            s.check([[-3]])
+            self.assertListEqual(model, s.model, "Atoms next to x2 != x3 should be decided false")
+
+        s = eq.DplltSolver(dict(identifier_map), x[:5], theory_branching=True)
+        s.check([[1, 2]])
+        s.push()
+        s.declare({5: eq.Equality(x[2], x[5])})
+        s.check([[5, 2]])
+        self.assertGreater(s.solver._scores[s.atoms[5] - 1], 0, "Atom declared after the first check should be seeded")
+        for solver_class in [eq.CdclSolver, eq.DplltSolver]:
+            check_cases(self, lambda identifier_map, variables: solver_class(identifier_map, variables,
+                                                                             theory_branching=True))
+
+    def test_theory_check_policies(self):
+        identifier_map, variables, formula, sat = complicated_tseitin_case()
+
+        checks = dict()
+        for policy in [pysat.FinalOnly(), pysat.EveryFixpoint(), pysat.EveryDecisions(2), pysat.NewAtoms()]:
+            s = eq.DplltSolver(identifier_map, variables, theory_check=policy)
+            self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+            checks[type(policy)] = s.solver._theoryChecks, s.solver._decisions
+
+        self.assertEqual(0, checks[pysat.FinalOnly][0], "FinalOnly should only check complete assignments")
+        self.assertGreaterEqual(checks[pysat.EveryFixpoint][0], checks[pysat.EveryFixpoint][1],
+                                "EveryFixpoint should check the fixpoint of each decision")
+        self.assertLessEqual(checks[pysat.EveryDecisions][0], checks[pysat.EveryDecisions][1] // 2 + 1,
+                             "EveryDecisions(2) should check once every 2 decisions")
+        self.assertLess(checks[pysat.NewAtoms][0], checks[pysat.EveryFixpoint][0],
+                        "NewAtoms should skip the fixpoints that only assign Tseitin variables")
+        for policy in [pysat.EveryDecisions, pysat.NewAtoms, pysat.Adaptive]:
+            check_cases(self, lambda identifier_map, variables: eq.DplltSolver(identifier_map, variables,
+                                                                               theory_check=policy()))
+
+
+class ScopeTestCase(unittest.TestCase):
+
+    def check_scopes(self, solver_class):
+        identifier_map, variables, formula, sat = simple_sat_case()
+
+        s = solver_class(identifier_map, variables)
+        self.assertEqual(pysat.lit_True, s.check(formula), "SAT is incorrect")
+
+        s.push()
+        s.declare({4: eq.Equality(variables[3], variables[0])})
+        self.assertEqual(pysat.lit_False, s.check([[-4]]), "SAT is incorrect")
+
+        s.pop()
+        self.assertEqual(pysat.lit_True, s.check([]), "SAT is incorrect")
+        self.assertListEqual([1, 2, 3], s.model, "Model is incorrect")
+        self.assertListEqual(formula, s.formula[:3], "Formula is incorrect")
+
+        s.push()
+        s.declare({4: eq.Equality(variables[3], eq.Variable('x5'))})
+        self.assertEqual(pysat.lit_True, s.check([[-4]]), "Atom 4 should not keep the lemmas of its old relation")
+        self.assertListEqual([1, 2, 3, -4], s.model, "Model is incorrect")
+
+        s.push()
+        self.assertEqual(pysat.lit_False, s.check([[4, -1], [4, 1]]), "SAT is incorrect")
+        s.pop()
+        self.assertEqual(pysat.lit_True, s.check([]), "SAT is incorrect")
+
+    def test_cdcl(self):
+        self.check_scopes(eq.CdclSolver)
+
+    def test_dpllt(self):
+        self.check_scopes(eq.DplltSolver)
+
+    def test_declare_used_variable(self):
+        x, y = eq.Variable('x'), eq.Variable('y')
+
+        for solver_class in [eq.CdclSolver, eq.DplltSolver]:
+            s = solver_class({1: eq.Equality(x, y)}, [x, y])
+            self.assertEqual(pysat.lit_True, s.check([[2], [-1]]), "SAT is incorrect")
+
+            s.push()
+            s.declare({2: eq.Equality(x, y)})
+            self.assertEqual(pysat.lit_False, s.check([]), "Variable 2, true at level 0, should merge x and y")
+            self.assertRaises(ValueError, s.declare, {2: eq.Equality(y, x)})
+
+            s.pop()
+            self.assertEqual(pysat.lit_False, s.check([[-2]]), "Variable 2 should keep its clauses after pop")
+
+
+class TriangleTestCase(unittest.TestCase):
+
+    def test_triangle_lemmas(self):
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        t = eq.Theory(identifier_map, variables)
+        t.triangles = True
+        t.new_var = lambda: 5
+        t.on_assign([1, 2, 3, -4])
+
+        self.assertListEqual([[5, -3, -2], [4, -5, -1]], t.learn_clauses(), "Triangle lemmas are incorrect")
+        self.assertEqual(variables[3], t.identifier_map[5].left, "Chord atom is incorrect")
+        self.assertEqual(variables[1], t.identifier_map[5].right, "Chord atom is incorrect")
+
+    def test_solvers(self):
+        identifier_map, variables, formula, sat = simple_unsat_case()
+
+        for solver_class in [eq.CdclSolver, eq.DplltSolver]:
+            s = solver_class(identifier_map, variables, triangles=True)
+
+            self.assertEqual(sat, s.check(formula), "SAT is incorrect")
+            self.assertCountEqual([[5, -3, -2], [4, -5, -1]], [c.to_list_of_ints() for c in s.solver._lemmas.values()],
+                                  "The lemmas should be the triangles of the chord x4 == x2")
+            self.assertEqual(variables[3], s.theory.identifier_map[5].left, "Chord atom is incorrect")
+            self.assertEqual(variables[1], s.theory.identifier_map[5].right, "Chord atom is incorrect")
+            self.assertListEqual(formula, s.formula, "Formula should not contain the chord atom")
+            check_cases(self, lambda identifier_map, variables: solver_class(identifier_map, variables,
+                                                                             triangles=True))
+
+
 if __name__ == '__main__':
     unittest.main()
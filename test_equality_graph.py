@@ -0,0 +1,107 @@
+import unittest
+import equivalence as eq
+import equality_graph
+
+
+def cycle(n):
+    variables = [eq.Variable('x' + str(i)) for i in range(n)]
+    identifier_map = dict()
+    for i in range(n):
+        identifier_map[i + 1] = eq.Equality(variables[i], variables[(i + 1) % n])
+    return identifier_map, variables
+
+
+class EqualityGraphTestCase(unittest.TestCase):
+
+    def test_edges(self):
+        x1, x2, x3 = eq.Variable('x1'), eq.Variable('x2'), eq.Variable('x3')
+        g = equality_graph.EqualityGraph(
+            {1: eq.Equality(x1, x2), 2: eq.Equality(x2, x1), 3: eq.Equality(x3, x3)}, [x1, x2, x3])
+
+        self.assertDictEqual({(0, 1): [1, 2]}, g.edges, "Edges are incorrect")
+        self.assertListEqual([3], g.loops, "Loops are incorrect")
+
+    def test_triangulate_cycle(self):
+        for heuristic in ['min_degree', 'min_fill']:
+            g = equality_graph.EqualityGraph(*cycle(6))
+            fill, triangles = g.triangulate(heuristic)
+
+            self.assertEqual(3, len(fill), "A cycle of 6 nodes needs 3 chords")
+            self.assertEqual(4, len(triangles), "A triangulated cycle of 6 nodes has 4 triangles")
+            self.assertEqual(6, len(g.edges), "The graph should not be modified")
+
+    def test_triangulate_unknown_heuristic(self):
+        g = equality_graph.EqualityGraph(*cycle(3))
+
+        self.assertRaises(ValueError, g.triangulate, 'max_degree')
+
+
+def bowtie():
+    """
+    Two triangles sharing x2, and a bridge from x4 to x5:
+    1: x0 == x1, 2: x1 == x2, 3: x2 == x0, 4: x2 == x3, 5: x3 == x4, 6: x4 == x2, 7: x4 == x5
+    """
+
+    variables = [eq.Variable('x' + str(i)) for i in range(6)]
+    sides = [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 2), (4, 5)]
+    identifier_map = dict()
+    for var, (i, j) in enumerate(sides):
+        identifier_map[var + 1] = eq.Equality(variables[i], variables[j])
+    return identifier_map, variables
+
+
+class RangeAllocationTestCase(unittest.TestCase):
+
+    def test_components(self):
+        g = equality_graph.EqualityGraph(*bowtie())
+        x1, x2 = eq.Variable('x1'), eq.Variable('x2')
+        h = equality_graph.EqualityGraph({1: eq.Equality(x1, x1)}, [x1, x2])
+
+        self.assertListEqual([[0, 1, 2, 3, 4, 5]], g.components(), "Components are incorrect")
+        self.assertListEqual([], h.components(), "Nodes without edges have no component")
+
+    def test_ranges(self):
+        identifier_map, variables = cycle(3)
+        identifier_map[4] = eq.Equality(eq.Variable('y0'), eq.Variable('y1'))
+        g = equality_graph.EqualityGraph(identifier_map, variables + [eq.Variable('y0'), eq.Variable('y1')])
+
+        self.assertDictEqual({0: 1, 1: 2, 2: 3, 3: 1, 4: 2}, g.ranges(), "Ranges are incorrect")
+
+    def test_ranges_polarity(self):
+        identifier_map, variables = cycle(3)
+        identifier_map[4] = eq.Equality(eq.Variable('y0'), eq.Variable('y1'))
+        g = equality_graph.EqualityGraph(identifier_map, variables + [eq.Variable('y0'), eq.Variable('y1')])
+
+        self.assertDictEqual({0: 1, 1: 2, 2: 2, 3: 1, 4: 1}, g.ranges({1: 1, 2: 1, 3: -1, 4: 1}),
+                             "A component with one atom that can be false needs two values")
+        self.assertDictEqual({0: 1, 1: 1, 2: 1, 3: 1, 4: 1}, g.ranges({1: 1, 2: 1, 3: 1}),
+                             "Components without disequalities need a single value")
+
+
+class PruningTestCase(unittest.TestCase):
+
+    def test_biconnected_components(self):
+        g = equality_graph.EqualityGraph(*bowtie())
+
+        components = sorted(sorted(component) for component in g.biconnected_components())
+        self.assertListEqual([[1, 2, 3], [4, 5, 6], [7]], components, "Components are incorrect")
+
+    def test_parallel_atoms(self):
+        x1, x2 = eq.Variable('x1'), eq.Variable('x2')
+        g = equality_graph.EqualityGraph({1: eq.Equality(x1, x2), 2: eq.Equality(x2, x1)}, [x1, x2])
+
+        self.assertListEqual([[2, 1]], g.biconnected_components(), "Parallel atoms form a cycle")
+
+    def test_polarity(self):
+        self.assertDictEqual({1: 1, 2: 0, 3: -1}, equality_graph.polarity([[1, 2], [-2, -3], [1]]),
+                             "Polarity is incorrect")
+
+    def test_pure_atoms(self):
+        g = equality_graph.EqualityGraph(*bowtie())
+
+        pure = g.pure_atoms(equality_graph.polarity([[1, 2, 3, 4, 5, 6, -7], [-4]]))
+        self.assertSetEqual({1, 2, 3, 7}, pure, "Only the second triangle has an atom that can be false")
+
+
+if __name__ == '__main__':
+    unittest.main()
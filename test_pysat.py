@@ -0,0 +1,310 @@
+import unittest
+import pysat
+
+
+def new_solver(formula):
+    s = pysat.Solver()
+    s._config.verbosity = 0
+    for clause in formula:
+        s.addClause(clause)
+    s.buildDataStructure()
+    return s
+
+
+class IncrementalTestCase(unittest.TestCase):
+
+    def test_add_clauses_between_solves(self):
+        s = new_solver([[1, 2], [-1, 3]])
+
+        self.assertEqual(pysat.lit_True, s.solve(), "SAT is incorrect")
+
+        s.addClause([-3])
+        self.assertEqual(pysat.lit_True, s.solve(), "SAT is incorrect")
+        self.assertListEqual([-1, 2, -3], s.finalModel, "Model is incorrect")
+
+        s.addClause([-2, 4])
+        s.addClause([-4, 1])
+        self.assertEqual(pysat.lit_False, s.solve(), "SAT is incorrect")
+        self.assertEqual(pysat.lit_False, s.solve(), "UNSAT should be kept")
+        self.assertListEqual([], s.finalModel, "Model is incorrect")
+
+    def test_learnt_clauses_are_kept(self):
+        formula = [[a, b, c] for a in (1, -1) for b in (2, -2) for c in (3, -3) if (a, b, c) != (1, 2, 3)]
+        s = new_solver(formula + [[4, 5]])
+
+        self.assertEqual(pysat.lit_True, s.solve(), "SAT is incorrect")
+        learnts = len(s._learnts)
+        s.addClause([-4])
+        self.assertEqual(pysat.lit_True, s.solve(), "SAT is incorrect")
+        self.assertGreaterEqual(len(s._learnts), learnts, "Learnt clauses should be kept")
+        self.assertListEqual([-1, -2, -3, -4, 5], s.finalModel, "Model is incorrect")
+
+
+class AssumptionsTestCase(unittest.TestCase):
+
+    def test_solve_under_assumptions(self):
+        s = new_solver([[-1, 2], [-2, 3], [-4, -3], [5, 6]])
+
+        self.assertEqual(pysat.lit_True, s.solve(assumptions=[1, -5]), "SAT is incorrect")
+        self.assertListEqual([1, 2, 3, -4, -5, 6], s.finalModel, "Model is incorrect")
+        self.assertListEqual([], s.finalConflict, "Conflict is incorrect")
+
+        self.assertEqual(pysat.lit_False, s.solve(assumptions=[-5, 1, 4]), "SAT is incorrect")
+        self.assertCountEqual([1, 4], s.finalConflict, "Conflict is incorrect")
+
+        self.assertEqual(pysat.lit_True, s.solve(assumptions=[4]), "UNSAT under assumptions should not be kept")
+        self.assertListEqual([-1, -2, -3], s.finalModel[:3], "Model is incorrect")
+
+    def test_assumption_false_at_level_0(self):
+        s = new_solver([[-1], [2, 3]])
+
+        self.assertEqual(pysat.lit_False, s.solve(assumptions=[2, 1]), "SAT is incorrect")
+        self.assertListEqual([1], s.finalConflict, "Conflict is incorrect")
+        self.assertEqual(pysat.lit_True, s.solve(), "SAT is incorrect")
+
+    def test_assumption_true_at_level_0(self):
+        s = new_solver([[1], [-1, 2]])
+
+        self.assertEqual(pysat.lit_True, s.solve(assumptions=[2]), "SAT is incorrect")
+        self.assertCountEqual([1, 2], [pysat.pysat.lit_to_int(l) for l in s._trail], "Level 0 should be kept")
+        self.assertEqual(len(s._trail), s._trailIndexToPropagate, "Level 0 should stay propagated")
+
+        s.addClause([-2, 3])
+        s.addClause([-3, -1])
+        self.assertEqual(pysat.lit_False, s.solve(), "SAT is incorrect")
+
+
+class PropagationTestCase(unittest.TestCase):
+
+    def test_literal_values(self):
+        s = new_solver([[-1, 2], [-2, 3, 4], [-2, -3], [-4, 5, 6], [-5, -1]])
+
+        s._newDecisionLevel()
+        s._uncheckedEnqueue(pysat.pysat.int_to_lit(1))
+        self.assertIsNone(s._propagate(), "No conflict expected")
+        self.assertCountEqual([1, 2, -3, 4, -5, 6], [pysat.pysat.lit_to_int(l) for l in s._trail],
+                              "Propagation is incorrect")
+        for i in [1, 2, -3, 4, -5, 6]:
+            l = pysat.pysat.int_to_lit(i)
+            self.assertEqual(pysat.lit_True, s._valueLit(l), "Literal value is incorrect")
+            self.assertEqual(pysat.lit_False, s._valueLit(pysat.pysat.not_lit(l)), "Literal value is incorrect")
+
+        s._cancelUntil(0)
+        self.assertTrue(all(s._valueLit(l) == pysat.lit_Undef for l in range(2 * s._nbvars)),
+                        "Backtracking should unassign both literals")
+
+
+def pigeonhole(n):
+    """ n + 1 pigeons in n holes (UNSAT): p(i, j) is the variable i * n + j + 1 """
+    formula = [[i * n + j + 1 for j in range(n)] for i in range(n + 1)]
+    formula += [[-(i * n + j + 1), -(k * n + j + 1)] for j in range(n) for i in range(n + 1) for k in range(i)]
+    return formula
+
+
+class LearntDBTestCase(unittest.TestCase):
+
+    def test_reduce_db(self):
+        s = pysat.Solver()
+        s._config.verbosity = 0
+        s._config.firstReduceDB = 20
+        s._config.reduceDBInc = 10
+        for clause in pigeonhole(5):
+            s.addClause(clause)
+        s.buildDataStructure()
+
+        self.assertEqual(pysat.lit_False, s.solve(), "SAT is incorrect")
+        self.assertGreater(s._learntsDeleted, 0, "Learnt clauses should be deleted")
+        self.assertTrue(all(c.lbd is not None for c in s._learnts), "The LBD should be computed")
+
+        kept = set(map(id, s._clauses + s._learnts))
+        self.assertTrue(all(id(c) in kept for wl in s._watches for c, blocker in wl), "Deleted clauses should be detached")
+
+
+class MinimizationTestCase(unittest.TestCase):
+
+    def test_redundant_literal(self):
+        for minimization, learnt in [(False, [-3, -2, -1]), (True, [-3, -1])]:
+            s = pysat.Solver()
+            s._config.verbosity = 0
+            s._config.ccMinimization = minimization
+            for clause in [[-1, 2], [-3, -1, 5], [-3, -2, -5]]:
+                s.addClause(clause)
+            s.buildDataStructure()
+
+            self.assertEqual(pysat.lit_False, s.solve(assumptions=[1, 3]), "SAT is incorrect")
+            self.assertCountEqual(learnt, s._learnts[0].to_list_of_ints(), "x2 is implied by x1 in the clause")
+
+    def test_pigeonhole(self):
+        s = new_solver(pigeonhole(5))
+
+        self.assertEqual(pysat.lit_False, s.solve(), "SAT is incorrect")
+        self.assertLess(s._totLiterals, s._maxLiterals, "Learnt clauses should be minimized")
+
+
+class RestartTestCase(unittest.TestCase):
+
+    def test_strategies(self):
+        for strategy in ['geometric', 'luby', 'glucose']:
+            s = pysat.Solver()
+            s._config.verbosity = 0
+            s._config.restartStrategy = strategy
+            s._config.restartFirst = 10
+            for clause in pigeonhole(5):
+                s.addClause(clause)
+            s.buildDataStructure()
+
+            self.assertEqual(pysat.lit_False, s.solve(), "SAT is incorrect")
+
+    def test_unknown_strategy(self):
+        s = pysat.Solver()
+        s._config.restartStrategy = 'never'
+        s.addClause([1, 2])
+        self.assertRaises(ValueError, s.buildDataStructure)
+
+    def test_luby(self):
+        s = new_solver([[1, 2]])
+        policy = pysat.pysat.Luby(first=100, base=2)
+        budgets = []
+        for s._restarts in range(1, 8):
+            budgets.append(policy.budget(s))
+        self.assertListEqual([100, 100, 200, 100, 100, 200, 400], budgets, "Luby sequence is incorrect")
+
+    def test_glucose(self):
+        s = new_solver([[1, 2]])
+        policy = pysat.pysat.Glucose(lbdSize=10)
+
+        for _ in range(20):
+            policy.onConflict(s, 2)
+        self.assertFalse(policy.check(s), "No restart while the LBD is stable")
+        for _ in range(10):
+            policy.onConflict(s, 10)
+        self.assertTrue(policy.check(s), "The recent learnt clauses are worse than the average")
+        self.assertFalse(policy.check(s), "The queue should be cleared by a restart")
+
+
+class LemmaStoreTestCase(unittest.TestCase):
+
+    def test_duplicate_lemmas(self):
+        s = new_solver([[1, 2, 3], [-1, -2]])
+        lemma = [pysat.pysat.int_to_lit(i) for i in [1, -2, 3]]
+
+        c = s._addLemma(lemma)
+        self.assertIs(c, s._addLemma(list(reversed(lemma))), "The lemma should be learnt once")
+        self.assertEqual(1, len(s._lemmas), "The lemma should be stored once")
+        self.assertEqual(1, s._lemmaDuplicates, "The duplicate should be counted")
+        self.assertEqual(2, sum(1 for wl in s._watches for w in wl if w[0] is c), "The lemma should be watched twice")
+
+    def test_reduce_lemmas(self):
+        s = new_solver([[1, 2, 3, 4]])
+        lemmas = [s._addLemma([pysat.pysat.int_to_lit(i) for i in clause])
+                  for clause in [[1, 2, 3], [-1, 2, 3], [1, -2, 3], [1, 2, -3], [-1, -2]]]
+        for i, c in enumerate(lemmas):
+            c.score = i
+
+        s._reduceLemmas()
+        self.assertCountEqual(lemmas[2:], s._lemmas.values(), "The less active lemmas should be deleted")
+        self.assertFalse(any(w[0] is c for c in lemmas[:2] for wl in s._watches for w in wl), "Deleted lemmas should be detached")
+        self.assertEqual(2, s._lemmasDeleted, "The deleted lemmas should be counted")
+
+
+class AtMostOneTheory:
+    """ Toy theory forbidding any two of its variables to be true together """
+
+    def __init__(self, variables):
+        self.variables = variables
+        self.true = []
+        self.levels = []
+
+    def on_new_level(self):
+        self.levels.append(len(self.true))
+
+    def on_backtrack(self, level):
+        if len(self.levels) > level:
+            del self.true[self.levels[level]:]
+            del self.levels[level:]
+
+    def on_assign(self, lits):
+        self.true += [lit for lit in lits if lit in self.variables]
+        return self.final_check()
+
+    def final_check(self):
+        return pysat.lit_True if len(self.true) < 2 else pysat.lit_False
+
+    def learn_clauses(self):
+        return [[-self.true[0], -self.true[1]]]
+
+    def propagate(self):
+        return []
+
+    def is_atom(self, var):
+        return var in self.variables
+
+
+class TheoryConflictTestCase(unittest.TestCase):
+
+    def test_theory_conflicts_are_analyzed(self):
+        for dpll_t in [False, True]:
+            s = new_solver([[1, 4], [2, 4], [3, 4], [-4, 5], [-4, -5]])
+
+            self.assertEqual(pysat.lit_False, s.solve(theory=AtMostOneTheory([1, 2, 3]), dpll_t=dpll_t),
+                             "SAT is incorrect")
+            self.assertGreater(s._conflicts, 1, "Theory conflicts should be counted")
+
+            s = new_solver([[1, 2, 3], [1, 4], [2, 4]])
+
+            self.assertEqual(pysat.lit_True, s.solve(theory=AtMostOneTheory([1, 2, 3]), dpll_t=dpll_t),
+                             "SAT is incorrect")
+            self.assertEqual(1, len([lit for lit in s.finalModel[:3] if lit > 0]), "Model is incorrect")
+            self.assertTrue(s.finalModel[3] > 0, "Model is incorrect")
+
+    def test_theory_check_policies(self):
+        formula = [[1, 4], [2, 4], [3, 4], [-4, 5], [-4, -5], [6, 7], [-6, 8]]
+
+        for policy in [pysat.FinalOnly(), pysat.EveryFixpoint(), pysat.EveryDecisions(2), pysat.NewAtoms(),
+                       pysat.Adaptive()]:
+            s = new_solver(formula)
+
+            self.assertEqual(pysat.lit_False, s.solve(theory=AtMostOneTheory([1, 2, 3]), theoryCheck=policy),
+                             "SAT is incorrect")
+            if isinstance(policy, pysat.FinalOnly):
+                self.assertEqual(0, s._theoryChecks, "Partial checks should not happen")
+            else:
+                self.assertGreater(s._theoryConflicts, 0, "Theory conflicts should be counted")
+
+    def test_adaptive_skip(self):
+        policy = pysat.Adaptive(target=0.1, maxSkip=16)
+        s = new_solver([[1, 2]])
+
+        self.assertTrue(policy.ready(s), "Adaptive should start as DPLL(T)")
+        for _ in range(50):
+            policy.checked(s, False)
+        self.assertEqual(16, policy.skip, "Useless checks should be spaced out")
+        self.assertFalse(policy.ready(s), "Adaptive should wait for decisions")
+
+        for _ in range(10):
+            policy.checked(s, True)
+        self.assertEqual(0, policy.skip, "Conflicting checks should happen at each fixpoint")
+        self.assertTrue(policy.ready(s), "Conflicting checks should happen at each fixpoint")
+
+    def test_new_atoms_after_backjump(self):
+        policy = pysat.NewAtoms()
+        s = new_solver([[5, 6, 7]])
+        s._theory = AtMostOneTheory([1, 2, 3])
+        s._theoryCheck = policy
+
+        s._newDecisionLevel()
+        s._uncheckedEnqueue(pysat.pysat.int_to_lit(5))
+        s._newDecisionLevel()
+        for i in [6, 7]:
+            s._uncheckedEnqueue(pysat.pysat.int_to_lit(i))
+        self.assertFalse(policy.ready(s), "The trail holds no atom")
+
+        s._cancelUntil(1)
+        s._newDecisionLevel()
+        for i in [1, 6, 7]:
+            s._uncheckedEnqueue(pysat.pysat.int_to_lit(i))
+        self.assertTrue(policy.ready(s), "The atom enqueued after the backjump should be seen")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import union_find
+
+
+class UnionFindTestCase(unittest.TestCase):
+
+    def test_union(self):
+        uf = union_find.UnionFind(4)
+
+        self.assertTrue(uf.union(0, 1), "Union of distinct sets should merge")
+        self.assertFalse(uf.union(1, 0), "Union of the same set should not merge")
+        self.assertTrue(uf.same(0, 1), "0 and 1 should be in the same set")
+        self.assertFalse(uf.same(0, 2), "0 and 2 should be in different sets")
+
+    def test_long_chain(self):
+        n = 20000
+        uf = union_find.UnionFind(n)
+
+        for i in range(n - 1):
+            uf.union(i + 1, i)
+
+        self.assertTrue(uf.same(0, n - 1), "Chain ends should be in the same set")
+        self.assertLessEqual(max(uf.rank), 1, "Union by rank should keep the chain flat")
+
+    def test_add_and_clear(self):
+        uf = union_find.UnionFind(2)
+        index = uf.add()
+        uf.union(0, index)
+
+        self.assertEqual(2, index, "Index of the added set is incorrect")
+        self.assertTrue(uf.same(0, 2), "0 and 2 should be in the same set")
+
+        uf.clear()
+        self.assertFalse(uf.same(0, 2), "Clear should split all sets")
+
+
+class BacktrackableUnionFindTestCase(unittest.TestCase):
+
+    def test_backtrack(self):
+        uf = union_find.BacktrackableUnionFind(4)
+        uf.union(0, 1)
+        uf.checkpoint()
+        uf.union(1, 2)
+        uf.checkpoint()
+        uf.union(2, 3)
+
+        self.assertTrue(uf.same(0, 3), "0 and 3 should be in the same set")
+
+        uf.backtrack(1)
+        self.assertEqual(1, uf.level(), "Level is incorrect")
+        self.assertTrue(uf.same(0, 2), "Union at level 1 should be kept")
+        self.assertFalse(uf.same(0, 3), "Union at level 2 should be undone")
+
+        uf.backtrack(0)
+        self.assertTrue(uf.same(0, 1), "Union at level 0 should be kept")
+        self.assertFalse(uf.same(0, 2), "Union at level 1 should be undone")
+        self.assertListEqual([1, 0, 0, 0], uf.rank, "Ranks should be restored")
+
+    def test_explain(self):
+        uf = union_find.BacktrackableUnionFind(5)
+        uf.union(0, 1, 'a')
+        uf.union(2, 3, 'b')
+        uf.union(3, 4, 'c')
+        uf.checkpoint()
+        uf.union(1, 2, 'd')
+
+        self.assertCountEqual(['a', 'b', 'd'], uf.explain(0, 3), "Explanation is incorrect")
+        self.assertListEqual(['c'], uf.explain(4, 3), "Explanation is incorrect")
+
+        uf.backtrack(0)
+        uf.union(4, 0, 'e')
+        self.assertCountEqual(['a', 'c', 'e'], uf.explain(1, 3), "Explanation is incorrect")
+
+    def test_path(self):
+        uf = union_find.BacktrackableUnionFind(5)
+        uf.union(0, 1, 'a')
+        uf.union(2, 3, 'b')
+        uf.union(1, 2, 'c')
+        uf.union(3, 4, 'd')
+
+        path = uf.path(0, 4)
+        self.assertListEqual([0, 1, 2, 3, 4], path, "Path is incorrect")
+        self.assertListEqual(['a', 'c', 'b', 'd'], [uf.edge_reason(path[x - 1], path[x]) for x in range(1, 5)],
+                             "Reasons of the path are incorrect")
+        self.assertListEqual([3, 2, 1], uf.path(3, 1), "Path is incorrect")
+        self.assertListEqual([2], uf.path(2, 2), "Path is incorrect")
+
+    def test_backtrack_above_level(self):
+        uf = union_find.BacktrackableUnionFind(2)
+        uf.union(0, 1)
+        uf.backtrack(0)
+
+        self.assertTrue(uf.same(0, 1), "Backtracking above the current level should do nothing")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -37,3 +37,212 @@ class UnionNode:
         if self_root != other_root:
             other_root.parent = self_root
             self_root.children.append(other_root)
+
+
+class UnionFind:
+    """ Disjoint sets over the integers 0..size-1, stored as parent/rank arrays.
+    Uses union by rank and path compression, and an iterative find so that long
+    chains do not hit the recursion limit. """
+
+    def __init__(self, size=0):
+
+        self.parent = list(range(size))
+        self.rank = [0] * size
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self):
+        """ Adds a new singleton set and returns its index """
+        index = len(self.parent)
+        self.parent.append(index)
+        self.rank.append(0)
+        return index
+
+    def clear(self):
+        for i in range(len(self.parent)):
+            self.parent[i] = i
+            self.rank[i] = 0
+
+    def find(self, i):
+
+        parent = self.parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+
+        while parent[i] != root:  # path compression
+            parent[i], i = root, parent[i]
+
+        return root
+
+    def same(self, i, j):
+        return self.find(i) == self.find(j)
+
+    def union(self, i, j):
+        """ Merges the sets of i and j. Returns False if they were already the same set """
+
+        i_root = self.find(i)
+        j_root = self.find(j)
+
+        if i_root == j_root:
+            return False
+
+        if self.rank[i_root] < self.rank[j_root]:
+            i_root, j_root = j_root, i_root
+        self.parent[j_root] = i_root
+        if self.rank[i_root] == self.rank[j_root]:
+            self.rank[i_root] += 1
+
+        return True
+
+
+class BacktrackableUnionFind(UnionFind):
+    """ Union-find with an undo log, meant to follow the decision levels of a
+    solver. Uses union by rank without path compression, so that each union
+    can be undone by resetting a single parent pointer.
+
+    Next to it is kept a proof forest: each union adds an edge, labelled with
+    its reason, between the two elements that were merged. explain returns the
+    reasons on the path between two elements of the same set. """
+
+    def __init__(self, size=0):
+
+        super().__init__(size)
+        self.proof_parent = [-1] * size
+        self.proof_reason = [None] * size
+        self.log = []  # (child root, whether its new root rank was bumped, proof edge) for each union
+        self.checkpoints = []  # self.checkpoints[i] is the size of the log when level i + 1 was opened
+
+    def add(self):
+        self.proof_parent.append(-1)
+        self.proof_reason.append(None)
+        return super().add()
+
+    def clear(self):
+        super().clear()
+        for i in range(len(self.proof_parent)):
+            self.proof_parent[i] = -1
+            self.proof_reason[i] = None
+        self.log = []
+        self.checkpoints = []
+
+    def find(self, i):
+
+        parent = self.parent
+        while parent[i] != i:
+            i = parent[i]
+
+        return i
+
+    def union(self, i, j, reason=None):
+
+        i_root = self.find(i)
+        j_root = self.find(j)
+
+        if i_root == j_root:
+            return False
+
+        if self.rank[i_root] < self.rank[j_root]:
+            i_root, j_root = j_root, i_root
+            i, j = j, i
+        self.parent[j_root] = i_root
+        bumped = self.rank[i_root] == self.rank[j_root]
+        if bumped:
+            self.rank[i_root] += 1
+
+        self._reroot(j)  # j becomes the root of its proof tree, then hangs below i
+        self.proof_parent[j] = i
+        self.proof_reason[j] = reason
+        self.log.append((j_root, bumped, j, i))
+
+        return True
+
+    def _reroot(self, i):
+        """ Reverses the proof edges on the path from i to the root of its proof tree """
+
+        previous = -1
+        previous_reason = None
+        while i != -1:
+            parent = self.proof_parent[i]
+            reason = self.proof_reason[i]
+            self.proof_parent[i] = previous
+            self.proof_reason[i] = previous_reason
+            previous, previous_reason, i = i, reason, parent
+
+    def explain(self, i, j):
+        """ Returns the reasons of the proof edges on the path between i and j.
+        i and j must be in the same set. """
+
+        ancestors = dict()
+        depth = 0
+        node = i
+        while node != -1:
+            ancestors[node] = depth
+            depth += 1
+            node = self.proof_parent[node]
+
+        reasons = []
+        node = j
+        while node not in ancestors:
+            reasons.append(self.proof_reason[node])
+            node = self.proof_parent[node]
+        common = node
+
+        node = i
+        while node != common:
+            reasons.append(self.proof_reason[node])
+            node = self.proof_parent[node]
+
+        return [reason for reason in reasons if reason is not None]
+
+    def path(self, i, j):
+        """ Returns the nodes on the path from i to j in the proof forest.
+        i and j must be in the same set. """
+
+        ancestors = []
+        node = i
+        while node != -1:
+            ancestors.append(node)
+            node = self.proof_parent[node]
+        depth = dict((node, d) for d, node in enumerate(ancestors))
+
+        descendants = []
+        node = j
+        while node not in depth:
+            descendants.append(node)
+            node = self.proof_parent[node]
+
+        return ancestors[:depth[node] + 1] + descendants[::-1]
+
+    def edge_reason(self, i, j):
+        """ Returns the reason of the proof edge between i and j """
+
+        return self.proof_reason[i] if self.proof_parent[i] == j else self.proof_reason[j]
+
+    def checkpoint(self):
+        """ Opens a new level. Unions made from now on are undone when backtracking below it """
+        self.checkpoints.append(len(self.log))
+
+    def level(self):
+        return len(self.checkpoints)
+
+    def backtrack(self, level=0):
+        """ Backtracks to the given level, undoing every union made at the levels above it """
+
+        if len(self.checkpoints) <= level:
+            return
+
+        for x in range(len(self.log) - 1, self.checkpoints[level] - 1, -1):
+            child, bumped, i, j = self.log[x]
+            root = self.parent[child]
+            self.parent[child] = child
+            if bumped:
+                self.rank[root] -= 1
+            if self.proof_parent[i] != j:  # the proof edge may have been reversed by a later union
+                i = j
+            self.proof_parent[i] = -1
+            self.proof_reason[i] = None
+
+        del self.log[self.checkpoints[level]:]
+        del self.checkpoints[level:]